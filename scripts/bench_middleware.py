@@ -0,0 +1,131 @@
+"""Compare per-request overhead of the observability middleware.
+
+Drives the ASGI stack directly (no server, no sockets) so the numbers show
+middleware cost only: a bare Starlette app, the same app behind the
+``BaseHTTPMiddleware`` implementations used previously, and behind the
+current pure ASGI middleware.
+
+Usage: python scripts/bench_middleware.py [--requests N] [--json PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from bench_results import Result, write_results  # noqa: E402
+from core import metrics  # noqa: E402
+from core.metrics import StatsDMiddleware  # noqa: E402
+from core.tracing import TracingMiddleware, tracer  # noqa: E402
+
+
+class _NullStatsClient:
+    def incr(self, *args: object) -> None:
+        pass
+
+    def timing(self, *args: object) -> None:
+        pass
+
+
+class LegacyStatsDMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):  # type: ignore[override]
+        start = time.perf_counter()
+        response = await call_next(request)
+        client = metrics.statsd_client
+        if client is not None:
+            duration = int((time.perf_counter() - start) * 1000)
+            client.incr("request_count")
+            client.timing("request_duration", duration)
+        return response
+
+
+class LegacyTracingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):  # type: ignore[override]
+        with tracer.start_as_current_span("api_request_span"):
+            return await call_next(request)
+
+
+async def _endpoint(request: Request) -> PlainTextResponse:
+    return PlainTextResponse("ok")
+
+
+def _app(middleware: list[Middleware]) -> Starlette:
+    return Starlette(routes=[Route("/", _endpoint)], middleware=middleware)
+
+
+async def _run(app: Starlette, requests: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/",
+        "raw_path": b"/",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "server": ("bench", 80),
+        "client": ("bench", 1),
+    }
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        pass
+
+    for _ in range(min(requests, 1000)):
+        await app(dict(scope), receive, send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--json", help="write machine-readable results here")
+    args = parser.parse_args()
+
+    metrics.statsd_client = _NullStatsClient()  # type: ignore[assignment]
+    variants = {
+        "bare": [],
+        "base_http": [
+            Middleware(LegacyStatsDMiddleware),
+            Middleware(LegacyTracingMiddleware),
+        ],
+        "pure_asgi": [Middleware(StatsDMiddleware), Middleware(TracingMiddleware)],
+    }
+    results = {
+        name: asyncio.run(_run(_app(middleware), args.requests))
+        for name, middleware in variants.items()
+    }
+    bare = results["bare"]
+    print(f"{'stack':<12}{'us/request':>12}{'overhead us':>14}")
+    for name, per_request in results.items():
+        print(f"{name:<12}{per_request:>12.2f}{per_request - bare:>14.2f}")
+
+    if args.json:
+        write_results(
+            "middleware",
+            [Result(name, 1e6 / per_request) for name, per_request in results.items()],
+            args.json,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Measure enqueue -> stream -> process throughput and latency.
+
+Each case enqueues ``--messages`` tasks through :class:`TaskRepository`
+while :func:`process_tasks` consumes them, and reports messages per second
+and the p50/p99 time from enqueue to handler completion. Cases cover every
+combination of ``--read-counts`` (``redis_read_count``), ``--handler-ms``
+(simulated handler latency) and ``--status-ttls`` (``task_status_ttl``; 0
+disables status tracking).
+
+Runs against the Redis at ``--redis-url``; without it an in-process stand-in
+that implements the stream commands the pipeline uses is started, so the
+numbers show client-side cost only.
+
+Usage: python scripts/bench_pipeline.py [--redis-url URL] [--messages N]
+       [--read-counts 10,100] [--handler-ms 0,5] [--status-ttls 0,3600]
+       [--json PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from bench_results import Result, percentile, print_results, write_results  # noqa: E402
+from core.config import AppConfig  # noqa: E402
+from core.redis_client import create_redis  # noqa: E402
+from service.task_processor import process_tasks  # noqa: E402
+from tasks.models import TaskMessage, TaskPayload, TraceContext  # noqa: E402
+from tasks.repository import TaskRepository  # noqa: E402
+
+
+def _bytes(value: Any) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class StreamStandIn:
+    """In-memory stand-in for the Redis commands used by the pipeline.
+
+    Single consumer group semantics only: entries are delivered once, kept
+    pending until acknowledged, and never reclaimed.
+    """
+
+    def __init__(self) -> None:
+        self._streams: dict[bytes, list[tuple[bytes, dict[bytes, bytes]]]] = (
+            defaultdict(list)
+        )
+        self._pending: dict[bytes, set[bytes]] = defaultdict(set)
+        self._hashes: dict[bytes, dict[bytes, bytes]] = defaultdict(dict)
+        self._seq = itertools.count()
+        self._added = asyncio.Event()
+
+    async def xgroup_create(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    async def xgroup_createconsumer(self, *args: Any) -> None:
+        pass
+
+    async def xgroup_delconsumer(self, *args: Any) -> None:
+        pass
+
+    async def xinfo_consumers(self, *args: Any) -> list[dict[str, Any]]:
+        return []
+
+    async def hset(
+        self, key: str, *args: Any, mapping: dict[Any, Any] | None = None
+    ) -> int:
+        pairs = list(zip(args[::2], args[1::2])) + list((mapping or {}).items())
+        fields = self._hashes[_bytes(key)]
+        fields.update((_bytes(field), _bytes(value)) for field, value in pairs)
+        return len(pairs)
+
+    async def expire(self, key: str, seconds: int) -> int:
+        return int(_bytes(key) in self._hashes)
+
+    async def publish(self, channel: str, message: Any) -> int:
+        return 0
+
+    async def hdel(self, *args: Any) -> None:
+        pass
+
+    async def hgetall(self, *args: Any) -> dict[bytes, bytes]:
+        return {}
+
+    async def xautoclaim(self, *args: Any, **kwargs: Any) -> list[Any]:
+        return [b"0-0", [], []]
+
+    async def xpending(self, stream: str, group: str) -> dict[str, int]:
+        return {"pending": len(self._pending[_bytes(stream)])}
+
+    async def xlen(self, stream: str) -> int:
+        return len(self._streams[_bytes(stream)])
+
+    def register_script(self, script: str) -> Any:
+        # Scripts do nothing, except that one queued on a pipeline stores
+        # its first key's fields the way the task status script does.
+        async def run(
+            keys: list[str] | None = None,
+            args: list[Any] | None = None,
+            client: Any = None,
+        ) -> int:
+            if isinstance(client, _PipelineStandIn) and keys and args:
+                client.hset(keys[0], *args[2:])
+                client.expire(keys[0], args[0])
+            return 0
+
+        return run
+
+    async def xadd(self, stream: str, fields: dict[Any, Any], **kwargs: Any) -> bytes:
+        message_id = f"{int(time.time() * 1000)}-{next(self._seq)}".encode()
+        entry = {_bytes(key): _bytes(value) for key, value in fields.items()}
+        self._streams[_bytes(stream)].append((message_id, entry))
+        self._added.set()
+        return message_id
+
+    async def xreadgroup(
+        self,
+        group: str,
+        consumer: str,
+        streams: dict[str, str],
+        count: int = 1,
+        block: int | None = None,
+    ) -> list[Any]:
+        records = self._take(streams, count)
+        if not records and block is not None:
+            self._added.clear()
+            try:
+                await asyncio.wait_for(self._added.wait(), block / 1000)
+            except asyncio.TimeoutError:
+                return []
+            records = self._take(streams, count)
+        return records
+
+    def _take(self, streams: dict[str, str], count: int) -> list[Any]:
+        records = []
+        for name in streams:
+            key = _bytes(name)
+            entries = self._streams[key][:count]
+            if entries:
+                del self._streams[key][:count]
+                self._pending[key].update(message_id for message_id, _ in entries)
+                records.append((key, entries))
+        return records
+
+    def xack(self, stream: str, group: str, *ids: bytes) -> int:
+        self._pending[_bytes(stream)].difference_update(ids)
+        return len(ids)
+
+    def pipeline(self, transaction: bool = False) -> _PipelineStandIn:
+        return _PipelineStandIn(self)
+
+
+class _PipelineStandIn:
+    def __init__(self, redis: StreamStandIn) -> None:
+        self._redis = redis
+        self._commands: list[Any] = []
+
+    def xadd(self, *args: Any, **kwargs: Any) -> None:
+        self._commands.append(self._redis.xadd(*args, **kwargs))
+
+    def xack(self, *args: Any) -> None:
+        self._commands.append(asyncio.sleep(0, self._redis.xack(*args)))
+
+    def xdel(self, stream: str, *ids: bytes) -> None:
+        self._commands.append(asyncio.sleep(0, len(ids)))
+
+    def xlen(self, stream: str) -> None:
+        self._commands.append(self._redis.xlen(stream))
+
+    def hset(self, *args: Any, **kwargs: Any) -> None:
+        self._commands.append(self._redis.hset(*args, **kwargs))
+
+    def expire(self, *args: Any) -> None:
+        self._commands.append(self._redis.expire(*args))
+
+    def publish(self, *args: Any) -> None:
+        self._commands.append(self._redis.publish(*args))
+
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:
+        commands, self._commands = self._commands, []
+        replies: list[Any] = []
+        for command in commands:
+            try:
+                replies.append(await command)
+            except Exception as exc:
+                if raise_on_error:
+                    raise
+                replies.append(exc)
+        return replies
+
+
+async def _run_case(
+    redis: Any, messages: int, read_count: int, handler_ms: float, status_ttl: int
+) -> Result:
+    stream = f"bench:{uuid.uuid4().hex}"
+    config = AppConfig(
+        redis_stream_name=stream,
+        redis_retry_key=f"{stream}:retry",
+        redis_dead_letter_stream=f"{stream}:dead",
+        redis_read_count=read_count,
+        redis_read_block_ms=100,
+        reclaim_interval=3600,
+        consumer_heartbeat_interval=3600,
+        task_status_ttl=status_ttl,
+    )
+    repo = TaskRepository(redis, stream, batch_size=100, batch_window=0.002)
+    latencies: list[float] = []
+    finished = asyncio.Event()
+
+    async def handler(message: TaskMessage) -> None:
+        if handler_ms:
+            await asyncio.sleep(handler_ms / 1000)
+        latencies.append(time.perf_counter() - message.payload.data)
+        if len(latencies) == messages:
+            finished.set()
+
+    shutdown_event = asyncio.Event()
+    consumer = asyncio.create_task(
+        process_tasks(config, handler, shutdown_event, redis)
+    )
+    trace_context = TraceContext(trace_id="", span_id="")
+    start = time.perf_counter()
+    for offset in range(0, messages, 1000):
+        await asyncio.gather(
+            *(
+                repo.add(
+                    TaskMessage(
+                        task_id=str(index),
+                        timestamp="",
+                        payload=TaskPayload(data=time.perf_counter()),
+                        trace_context=trace_context,
+                    )
+                )
+                for index in range(offset, min(messages, offset + 1000))
+            )
+        )
+    await finished.wait()
+    elapsed = time.perf_counter() - start
+    shutdown_event.set()
+    await consumer
+    await repo.close()
+    if not isinstance(redis, StreamStandIn):
+        await redis.delete(
+            stream,
+            config.redis_retry_key,
+            config.redis_dead_letter_stream,
+            f"{stream}:consumers:{config.redis_consumer_group}",
+        )
+        if status_ttl:
+            await redis.delete(
+                *(f"{stream}:status:{index}" for index in range(messages))
+            )
+
+    return Result(
+        f"read={read_count} handler={handler_ms:g}ms status_ttl={status_ttl}",
+        messages / elapsed,
+        percentile(latencies, 0.5) * 1000,
+        percentile(latencies, 0.99) * 1000,
+    )
+
+
+async def _run(args: argparse.Namespace) -> list[Result]:
+    if args.redis_url:
+        redis = create_redis(AppConfig(redis_url=args.redis_url))
+    else:
+        redis = StreamStandIn()
+    results = []
+    try:
+        for read_count, handler_ms, status_ttl in itertools.product(
+            args.read_counts, args.handler_ms, args.status_ttls
+        ):
+            results.append(
+                await _run_case(
+                    redis, args.messages, read_count, handler_ms, status_ttl
+                )
+            )
+    finally:
+        if args.redis_url:
+            await redis.aclose()
+    return results
+
+
+def _numbers(value: str) -> list[float]:
+    return [float(item) for item in value.split(",") if item]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-url")
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument(
+        "--read-counts", type=lambda v: [int(n) for n in _numbers(v)], default=[10, 100]
+    )
+    parser.add_argument("--handler-ms", type=_numbers, default=[0.0, 5.0])
+    parser.add_argument(
+        "--status-ttls", type=lambda v: [int(n) for n in _numbers(v)], default=[0, 3600]
+    )
+    parser.add_argument("--json", help="write machine-readable results here")
+    args = parser.parse_args()
+
+    logger.disable("service")
+    results = asyncio.run(_run(args))
+    print_results(results)
+    if args.json:
+        write_results("pipeline", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
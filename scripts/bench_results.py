@@ -0,0 +1,104 @@
+"""Machine-readable benchmark results and baseline comparison.
+
+Benchmark scripts called with ``--json PATH`` write a document of the form::
+
+    {"benchmark": "pipeline", "python": "3.11.9", "results": [
+        {"name": "read=100 handler=0ms", "ops_per_sec": 41250.0,
+         "p50_ms": 1.9, "p99_ms": 6.3}, ...]}
+
+Comparing two such files reports every case whose throughput dropped, or
+whose p99 latency grew, by more than the tolerance, and exits non-zero if
+there is one.
+
+Usage: python scripts/bench_results.py BASELINE CURRENT [--tolerance 0.1]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+
+@dataclass
+class Result:
+    """One benchmark case; latency fields are ``None`` when not measured."""
+
+    name: str
+    ops_per_sec: float
+    p50_ms: float | None = None
+    p99_ms: float | None = None
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Return the ``fraction`` percentile of ``samples`` (nearest rank)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def print_results(results: list[Result]) -> None:
+    """Print ``results`` as a table."""
+    print(f"{'case':<36}{'ops/s':>14}{'p50 ms':>10}{'p99 ms':>10}")
+    for result in results:
+        p50 = "-" if result.p50_ms is None else f"{result.p50_ms:.3f}"
+        p99 = "-" if result.p99_ms is None else f"{result.p99_ms:.3f}"
+        print(f"{result.name:<36}{result.ops_per_sec:>14.1f}{p50:>10}{p99:>10}")
+
+
+def write_results(benchmark: str, results: list[Result], path: str) -> None:
+    """Write ``results`` to ``path`` in the format described above."""
+    document = {
+        "benchmark": benchmark,
+        "python": platform.python_version(),
+        "results": [asdict(result) for result in results],
+    }
+    Path(path).write_text(json.dumps(document, indent=2) + "\n")
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    """Return a description of each regression in ``current``."""
+    before = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        if result["ops_per_sec"] < old["ops_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{result['name']}: throughput {old['ops_per_sec']:.1f} -> "
+                f"{result['ops_per_sec']:.1f} ops/s"
+            )
+        if old.get("p99_ms") and result.get("p99_ms") is not None:
+            if result["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{result['name']}: p99 {old['p99_ms']:.3f} -> "
+                    f"{result['p99_ms']:.3f} ms"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    regressions = compare(baseline, current, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Measure per-message encode/decode cost of each task wire format.
+
+Usage: python scripts/bench_serialization.py [--number N] [--json PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from bench_results import Result, write_results  # noqa: E402
+from tasks.models import TaskMessage, TraceContext  # noqa: E402
+from tasks.serialization import CODECS, decode_payload  # noqa: E402
+
+RAW_PAYLOAD = (
+    b'{"data": {"user_id": 12345, "items": [1, 2, 3, 4, 5], '
+    b'"note": "benchmark payload"}, "metadata": {"source": "bench"}}'
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100_000)
+    parser.add_argument("--json", help="write machine-readable results here")
+    args = parser.parse_args()
+
+    message = TaskMessage(
+        task_id="00000000-0000-0000-0000-000000000000",
+        timestamp="2025-01-01T00:00:00+00:00",
+        payload=decode_payload(RAW_PAYLOAD),
+        trace_context=TraceContext(trace_id="a" * 32, span_id="b" * 16),
+    )
+
+    print(
+        f"{'format':<10}{'encode us':>12}{'passthru us':>14}{'decode us':>12}{'bytes':>8}"
+    )
+    results = [
+        Result(
+            "decode_payload",
+            args.number
+            / timeit.timeit(lambda: decode_payload(RAW_PAYLOAD), number=args.number),
+        )
+    ]
+    for name, codec in CODECS.items():
+        encoded = codec.encode(message)
+        encode = timeit.timeit(lambda: codec.encode(message), number=args.number)
+        passthru = timeit.timeit(
+            lambda: codec.encode(message, RAW_PAYLOAD), number=args.number
+        )
+        decode = timeit.timeit(lambda: codec.decode(encoded), number=args.number)
+        per_msg = 1e6 / args.number
+        print(
+            f"{name:<10}{encode * per_msg:>12.3f}{passthru * per_msg:>14.3f}"
+            f"{decode * per_msg:>12.3f}{len(encoded):>8}"
+        )
+        for case, seconds in (
+            ("encode", encode),
+            ("passthru", passthru),
+            ("decode", decode),
+        ):
+            results.append(Result(f"{name} {case}", args.number / seconds))
+
+    if args.json:
+        write_results("serialization", results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Locust load scenarios for the HTTP API.
+
+``TaskProducer`` posts single tasks to ``/tasks`` and, less often, batches
+to ``/tasks/batch``; ``HealthPoller`` polls ``/health`` the way an
+orchestrator would. Run headless against a local service and keep the
+stats for comparison::
+
+    locust -f scripts/locustfile.py --headless -H http://localhost:8000 \\
+        -u 200 -r 50 -t 60s --json > locust.json
+
+``BENCH_BATCH_SIZE`` sets the number of items per batch request.
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+
+from locust import FastHttpUser, between, task
+
+BATCH_SIZE = int(os.environ.get("BENCH_BATCH_SIZE", "50"))
+
+_ids = itertools.count()
+
+
+def _payload() -> dict[str, object]:
+    return {
+        "data": {"user_id": next(_ids), "items": [1, 2, 3, 4, 5]},
+        "metadata": {"source": "locust"},
+    }
+
+
+class TaskProducer(FastHttpUser):
+    weight = 10
+    wait_time = between(0, 0.01)
+
+    @task(20)
+    def create_task(self) -> None:
+        self.client.post("/tasks", json=_payload())
+
+    @task(1)
+    def create_batch(self) -> None:
+        self.client.post(
+            "/tasks/batch",
+            json=[_payload() for _ in range(BATCH_SIZE)],
+            name=f"/tasks/batch [{BATCH_SIZE}]",
+        )
+
+
+class HealthPoller(FastHttpUser):
+    weight = 1
+    wait_time = between(0.5, 1.0)
+
+    @task
+    def health(self) -> None:
+        self.client.get("/health")
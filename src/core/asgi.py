@@ -0,0 +1,33 @@
+"""Small helpers shared by the ASGI middleware."""
+
+from __future__ import annotations
+
+from starlette.routing import BaseRoute
+from starlette.types import Scope
+
+_route_cache: dict[object, tuple[str, str]] = {}
+
+
+def route_info(scope: Scope) -> tuple[str, str]:
+    """Return ``(name, path template)`` of the route that handled ``scope``.
+
+    Only meaningful after the router has run, since it records the matched
+    endpoint in the scope. Unmatched requests yield ``("unmatched", "")``.
+    """
+
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "unmatched", ""
+    info = _route_cache.get(endpoint)
+    if info is None:
+        info = _find_route(getattr(app, "routes", []), endpoint)
+        _route_cache[endpoint] = info
+    return info
+
+
+def _find_route(routes: list[BaseRoute], endpoint: object) -> tuple[str, str]:
+    for route in routes:
+        if getattr(route, "endpoint", None) is endpoint:
+            return getattr(route, "name", "unknown"), getattr(route, "path", "")
+    return "unknown", ""
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from .logging_config import setup_logging
@@ -14,24 +16,92 @@ class AppConfig(BaseSettings):
     redis_url: str = "redis://localhost:6379"
     redis_stream_name: str = "tasks:stream"
     redis_consumer_group: str = "processors"
-    redis_consumer_name: str = "worker"
+    redis_consumer_name: str = ""
+    redis_max_connections: int = 64
+    redis_pool_timeout: float = 5.0
+    redis_socket_timeout: float = 5.0
+    redis_socket_connect_timeout: float = 2.0
+    redis_health_check_interval: int = 30
+    redis_pool_metrics_interval: float = 10.0
+    redis_read_count: int = 100
+    redis_read_block_ms: int = 1000
+    ack_batch_size: int = 100
+    ack_flush_interval: float = 0.05
+    reclaim_interval: float = 30.0
+    reclaim_min_idle_ms: int = 60000
+    reclaim_batch_size: int = 100
+    reclaim_max_deliveries: int = 5
+    consumer_heartbeat_interval: float = 10.0
+    consumer_ttl: float = 60.0
+    redis_retry_key: str = "tasks:retry"
+    redis_dead_letter_stream: str = "tasks:dead"
+    retry_max_attempts: int = 3
+    retry_backoff_base: float = 0.1
+    retry_backoff_factor: float = 2.0
+    retry_backoff_max: float = 60.0
+    retry_poll_interval: float = 0.5
+    enqueue_batch_size: int = 100
+    enqueue_batch_window: float = 0.002
+    queue_size_sample_interval: float = 5.0
+    stream_maxlen: int = 100000
+    stream_retention_seconds: float = 0.0
+    stream_trim_approximate: bool = True
+    stream_trim_interval: float = 5.0
+    task_wire_format: str = "json"
+    idempotency_ttl: int = 86400
+    idempotency_cache_size: int = 10000
+    completion_ttl: int = 0
+    task_status_ttl: int = 0
+    task_status_cache_ttl: float = 1.0
+    task_status_cache_size: int = 10000
+    task_status_max_wait: float = 30.0
+    priority_lanes: list[str] = []
+    priority_weights: list[int] = []
+    priority_default_lane: str = ""
+    priority_scheduler: str = "weighted"
+    priority_max_wait: float = 1.0
 
     statsd_host: str = "localhost"
     statsd_port: int = 8125
     statsd_prefix: str = "microservice"
+    statsd_flush_interval: float = 1.0
+    statsd_max_packet_size: int = 1432
 
     jaeger_endpoint: str = "http://localhost:14268/api/traces"
     jaeger_service_name: str = "generated-service"
+    trace_sampler: str = "parentbased_traceidratio"
+    trace_sample_ratio: float = 1.0
+    trace_max_queue_size: int = 2048
+    trace_max_export_batch_size: int = 512
+    trace_schedule_delay_ms: int = 5000
+    trace_export_timeout_ms: int = 30000
 
     loki_endpoint: str = "http://localhost:3100/loki/api/v1/push"
+    log_file_path: str = "loki.log"
+    log_file_max_bytes: int = 100 * 1024 * 1024
+    log_file_backup_count: int = 5
+    log_queue_size: int = 10000
+    log_batch_size: int = 256
+    log_overflow: str = "drop"
+    log_sample_rate: float = 0.1
 
     uvloop_enabled: bool = True
     worker_processes: str = "auto"
+    consumer_processes: int = 0
+    service_role: str = "all"
+    background_jobs: bool = True
     max_concurrent_tasks: int = 1000
     task_timeout: int = 30
+    handler_thread_workers: int = 4
+    handler_process_workers: int = 0
     max_payload_size: int = 1048576
+    batch_max_items: int = 1000
+    batch_max_bytes: int = 10485760
 
     shutdown_timeout: int = 30
+    health_probe_interval: float = 2.0
+    debug_token: str = ""
+    profile_max_seconds: float = 30.0
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -39,10 +109,19 @@ class AppConfig(BaseSettings):
     )
 
 
-def configure_logging() -> None:
+def configure_logging(config: AppConfig | None = None) -> None:
     """Configure application logging."""
 
-    setup_logging()
+    config = config or AppConfig()
+    setup_logging(
+        file_path=config.log_file_path or None,
+        queue_size=config.log_queue_size,
+        batch_size=config.log_batch_size,
+        overflow=config.log_overflow,
+        sample_rate=config.log_sample_rate,
+        max_bytes=config.log_file_max_bytes,
+        backup_count=config.log_file_backup_count,
+    )
 
 
 def get_config() -> AppConfig:
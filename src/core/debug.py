@@ -0,0 +1,105 @@
+"""Internal debugging endpoints: stage latencies and live profiling.
+
+The routes are only mounted when ``debug_token`` is set, and every request
+must carry it in ``X-Debug-Token``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import hmac
+import io
+import pstats
+import tracemalloc
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+
+from . import stages
+from .config import AppConfig
+
+_profile_lock = asyncio.Lock()
+
+
+def _authorized(request: Request, config: AppConfig) -> bool:
+    if not config.debug_token:
+        return False
+    token = request.headers.get("x-debug-token", "")
+    return hmac.compare_digest(token.encode(), config.debug_token.encode())
+
+
+async def debug_metrics(request: Request, config: AppConfig) -> Response:
+    """Return the per-stage latency histograms of this process.
+
+    Requires the ``X-Debug-Token`` header. ``?reset=1`` clears the
+    histograms after reading them.
+    """
+    if not _authorized(request, config):
+        return Response(status_code=403)
+    body = {"stages": stages.snapshot()}
+    if request.query_params.get("reset") == "1":
+        stages.reset()
+    return JSONResponse(body)
+
+
+async def debug_profile(request: Request, config: AppConfig) -> Response:
+    """Profile this worker for ``?seconds=N`` and return the report.
+
+    ``?kind=cpu`` (default) runs :mod:`cProfile` over the event loop thread
+    and lists the most expensive functions by cumulative time;
+    ``?kind=memory`` traces allocations with :mod:`tracemalloc` and lists
+    the lines that allocated most. Requires the ``X-Debug-Token`` header.
+    Only one profile runs at a time and its length is capped by
+    ``profile_max_seconds``.
+    """
+    if not _authorized(request, config):
+        return Response(status_code=403)
+    try:
+        seconds = float(request.query_params.get("seconds", "5"))
+    except ValueError:
+        return Response(status_code=400)
+    kind = request.query_params.get("kind", "cpu")
+    if kind not in ("cpu", "memory") or seconds <= 0:
+        return Response(status_code=400)
+    seconds = min(seconds, config.profile_max_seconds)
+    if _profile_lock.locked():
+        return Response(status_code=409)
+
+    async with _profile_lock:
+        if kind == "cpu":
+            report = await _profile_cpu(seconds)
+        else:
+            report = await _profile_memory(seconds)
+    if report is None:
+        return Response(status_code=409)
+    return PlainTextResponse(report)
+
+
+async def _profile_cpu(seconds: float) -> str | None:
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already attached to this thread.
+        return None
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(50)
+    return out.getvalue()
+
+
+async def _profile_memory(seconds: float) -> str | None:
+    if tracemalloc.is_tracing():
+        return None
+    tracemalloc.start()
+    try:
+        await asyncio.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    top = snapshot.statistics("lineno")[:50]
+    return "\n".join(str(stat) for stat in top) + "\n"
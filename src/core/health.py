@@ -0,0 +1,134 @@
+"""Background Redis health probing."""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Iterable, Mapping
+
+from loguru import logger
+from redis.asyncio import Redis
+
+
+@dataclass(frozen=True)
+class LaneHealth:
+    """Stream statistics of one priority lane."""
+
+    stream_length: int
+    consumer_lag: int | None = None
+    pending: int | None = None
+
+
+@dataclass(frozen=True)
+class HealthSnapshot:
+    """Result of the latest Redis probe."""
+
+    redis_connected: bool
+    checked_at: float
+    timestamp: str
+    ping_ms: float | None = None
+    stream_length: int | None = None
+    consumer_lag: int | None = None
+    pending: int | None = None
+    lanes: dict[str, LaneHealth] | None = None
+
+
+class HealthProbe:
+    """Probe Redis periodically and keep the latest :class:`HealthSnapshot`.
+
+    Health endpoints read :attr:`snapshot` instead of talking to Redis, so
+    frequent load-balancer probes cost no I/O. A snapshot older than
+    ``stale_after`` seconds is reported as unhealthy.
+
+    With ``lanes`` (lane name to stream, see :mod:`tasks.lanes`) every lane
+    stream is probed in the same round trip; the snapshot carries per-lane
+    statistics and their totals. Without
+    ``stream_stats`` the probe only pings, leaving the stream statistics to
+    another process.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream: str,
+        group: str,
+        stale_after: float = 10.0,
+        stream_stats: bool = True,
+        lanes: Mapping[str, str] | None = None,
+    ) -> None:
+        self._redis = redis
+        self._stream = stream
+        self._group = group.encode()
+        self._stale_after = stale_after
+        self._stream_stats_enabled = stream_stats
+        self._lanes = dict(lanes or {})
+        self.snapshot: HealthSnapshot | None = None
+
+    def healthy(self) -> bool:
+        """Return whether the latest snapshot is fresh and Redis answered."""
+        snapshot = self.snapshot
+        return (
+            snapshot is not None
+            and snapshot.redis_connected
+            and time.monotonic() - snapshot.checked_at <= self._stale_after
+        )
+
+    async def probe(self) -> HealthSnapshot:
+        """Ping Redis, read stream and group statistics and store them."""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        try:
+            start = time.perf_counter()
+            await self._redis.ping()
+            ping_ms = (time.perf_counter() - start) * 1000
+        except Exception as exc:
+            logger.error(f"Health probe failed: {exc}")
+            snapshot = HealthSnapshot(False, time.monotonic(), timestamp)
+        else:
+            snapshot = HealthSnapshot(
+                True, time.monotonic(), timestamp, ping_ms=round(ping_ms, 3)
+            )
+            try:
+                if self._stream_stats_enabled:
+                    snapshot = await self._stream_stats(snapshot)
+            except Exception as exc:
+                logger.error(f"Health probe stream stats failed: {exc}")
+        self.snapshot = snapshot
+        return snapshot
+
+    async def _stream_stats(self, snapshot: HealthSnapshot) -> HealthSnapshot:
+        streams = self._lanes or {"": self._stream}
+        pipe = self._redis.pipeline(transaction=False)
+        for stream in streams.values():
+            pipe.xlen(stream)
+            pipe.xinfo_groups(stream)
+        replies = await pipe.execute()
+        lanes = {
+            lane: LaneHealth(int(length), *self._group_stats(groups))
+            for lane, length, groups in zip(streams, replies[::2], replies[1::2])
+        }
+        return replace(
+            snapshot,
+            stream_length=sum(lane.stream_length for lane in lanes.values()),
+            consumer_lag=_total(lane.consumer_lag for lane in lanes.values()),
+            pending=_total(lane.pending for lane in lanes.values()),
+            lanes=lanes if self._lanes else None,
+        )
+
+    def _group_stats(self, groups: list[dict]) -> tuple[int | None, int | None]:
+        for group in groups:
+            name = group["name"]
+            if (name if isinstance(name, bytes) else name.encode()) == self._group:
+                lag = group.get("lag")
+                pending = group.get("pending")
+                return (
+                    None if lag is None else int(lag),
+                    None if pending is None else int(pending),
+                )
+        return None, None
+
+
+def _total(values: Iterable[int | None]) -> int | None:
+    """Sum the known values; ``None`` if none is known."""
+    known = [value for value in values if value is not None]
+    return sum(known) if known else None
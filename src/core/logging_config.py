@@ -2,12 +2,22 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import os
+import queue
+import random
 import sys
+import threading
+import time
+from typing import Any, BinaryIO, TextIO
 
+import orjson
 from loguru import logger
 from pythonjsonlogger import jsonlogger
 
+OVERFLOW_POLICIES = ("drop", "sample", "block")
+
 
 class LokiJsonFormatter(jsonlogger.JsonFormatter):
     """JSON formatter limited to the required fields."""
@@ -22,23 +32,245 @@ class LokiJsonFormatter(jsonlogger.JsonFormatter):
                 log_record.pop(key)
 
 
-def setup_logging() -> None:
-    """Configure Loguru with JSON output for Loki."""
+class LogPipeline:
+    """Non-blocking log sink writing JSON lines from a background thread.
+
+    Callers only format a record and put it on a bounded queue; a writer
+    thread takes records off in batches and writes each batch to stdout and
+    to a size-rotated file with one call per output. When the queue is full
+    the ``overflow`` policy applies: ``drop`` discards the record, ``block``
+    waits for room, and ``sample`` additionally keeps only a
+    ``sample_rate`` fraction of sub-WARNING records once the queue is half
+    full. Discarded records are counted in :attr:`dropped`.
+
+    With ``stdout`` the lines go to whatever :data:`sys.stdout` is when
+    they are written, rather than to a fixed ``stream``, so replacing it
+    later (as test capture does) does not leave the writer on a closed
+    stream.
+
+    Instances are loguru sinks (see :meth:`write`); loguru calls
+    :meth:`stop` when the sink is removed.
+    """
+
+    def __init__(
+        self,
+        stream: TextIO | None = None,
+        file_path: str | None = None,
+        queue_size: int = 10000,
+        batch_size: int = 256,
+        overflow: str = "drop",
+        sample_rate: float = 0.1,
+        max_bytes: int = 100 * 1024 * 1024,
+        backup_count: int = 5,
+        stdout: bool = False,
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log overflow policy: {overflow}")
+        self._stream = stream
+        self._stdout = stdout
+        self._file_path = file_path
+        self._file: BinaryIO | None = None
+        self._file_size = 0
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._queue: queue.Queue[bytes | None] = queue.Queue(max(1, queue_size))
+        self._batch_size = max(1, batch_size)
+        self._overflow = overflow
+        self._sample_rate = sample_rate
+        self._sample_threshold = max(1, queue_size // 2)
+        self._stopped = False
+        self.dropped = 0
+        self._reported = 0
+        if file_path is not None:
+            self._open_file()
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, message: Any) -> None:
+        """Format a loguru message and queue it."""
+        record = message.record
+        extra = record["extra"]
+        line = orjson.dumps(
+            {
+                "timestamp": record["time"].isoformat(),
+                "level": record["level"].name,
+                "message": record["message"],
+                "task_id": extra.get("task_id"),
+                "trace_id": extra.get("trace_id"),
+            },
+            default=str,
+        )
+        self.put(line, record["level"].no)
+
+    def put(self, line: bytes, level: int = logging.INFO) -> None:
+        """Queue one formatted line according to the overflow policy."""
+        if self._stopped:
+            return
+        if self._overflow == "block":
+            self._queue.put(line)
+            return
+        if (
+            self._overflow == "sample"
+            and level < logging.WARNING
+            and self._queue.qsize() >= self._sample_threshold
+            and random.random() >= self._sample_rate
+        ):
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def drain(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued line is written; return whether it was."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    async def complete(self) -> None:
+        """Let ``await logger.complete()`` wait for queued lines."""
+        await asyncio.to_thread(self.drain)
+
+    def stop(self) -> None:
+        """Write remaining lines and stop the writer thread."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def report_dropped(self) -> None:
+        """Send the number of lines dropped since the last report to StatsD."""
+        from . import metrics
+
+        dropped = self.dropped
+        delta, self._reported = dropped - self._reported, dropped
+        if delta and metrics.statsd_client is not None:
+            metrics.statsd_client.incr("log_records_dropped", delta)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = [line for line in batch if line is not None]
+            if lines:
+                try:
+                    self._write(b"\n".join(lines) + b"\n")
+                except Exception as exc:  # pragma: no cover - defensive
+                    sys.stderr.write(f"Log write failed: {exc}\n")
+            for _ in batch:
+                self._queue.task_done()
+            if len(lines) != len(batch):
+                return
+
+    def _write(self, data: bytes) -> None:
+        stream = sys.stdout if self._stdout else self._stream
+        if stream is not None:
+            stream.write(data.decode())
+            stream.flush()
+        if self._file is not None:
+            if self._max_bytes and self._file_size + len(data) > self._max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._file_size += len(data)
+
+    def _open_file(self) -> None:
+        assert self._file_path is not None
+        self._file = open(self._file_path, "ab")
+        self._file_size = self._file.tell()
+
+    def _rotate(self) -> None:
+        assert self._file is not None and self._file_path is not None
+        self._file.close()
+        if self._backup_count > 0:
+            for index in range(self._backup_count - 1, 0, -1):
+                source = f"{self._file_path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self._file_path}.{index + 1}")
+            os.replace(self._file_path, f"{self._file_path}.1")
+        else:
+            os.remove(self._file_path)
+        self._open_file()
+
+
+class _PipelineHandler(logging.Handler):
+    """Route standard library log records into a :class:`LogPipeline`."""
+
+    def __init__(self, pipeline: LogPipeline) -> None:
+        super().__init__()
+        self._pipeline = pipeline
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._pipeline.put(self.format(record).encode(), record.levelno)
+        except Exception:  # pragma: no cover - defensive
+            self.handleError(record)
+
+
+_pipeline: LogPipeline | None = None
+
+
+def get_log_pipeline() -> LogPipeline | None:
+    """Return the active log pipeline, if logging is configured."""
+    return _pipeline
+
+
+def flush_logs(timeout: float = 5.0) -> bool:
+    """Block until queued log lines are written."""
+    return _pipeline.drain(timeout) if _pipeline is not None else True
+
+
+def setup_logging(
+    file_path: str | None = "loki.log",
+    queue_size: int = 10000,
+    batch_size: int = 256,
+    overflow: str = "drop",
+    sample_rate: float = 0.1,
+    max_bytes: int = 100 * 1024 * 1024,
+    backup_count: int = 5,
+) -> None:
+    """Configure Loguru with JSON output for Loki.
+
+    Records from both loguru and the standard library go through one
+    :class:`LogPipeline`, so emitting a log line never blocks on I/O.
+    """
+
+    global _pipeline
 
     logger.remove()
 
+    pipeline = LogPipeline(
+        stdout=True,
+        file_path=file_path,
+        queue_size=queue_size,
+        batch_size=batch_size,
+        overflow=overflow,
+        sample_rate=sample_rate,
+        max_bytes=max_bytes,
+        backup_count=backup_count,
+    )
+
     formatter = LokiJsonFormatter(
         fmt="%(asctime)s %(levelname)s %(message)s %(task_id)s %(trace_id)s",
         rename_fields={"asctime": "timestamp", "levelname": "level"},
     )
-
-    handler = logging.StreamHandler(sys.stdout)
+    handler = _PipelineHandler(pipeline)
     handler.setFormatter(formatter)
 
     logging.basicConfig(handlers=[handler], level=logging.INFO, force=True)
-    logger.add(handler, level="INFO", enqueue=False, format="{message}")
-
-    file_handler = logging.FileHandler("loki.log")
-    file_handler.setFormatter(formatter)
-    logging.getLogger().addHandler(file_handler)
-    logger.add(file_handler, level="INFO", enqueue=False, format="{message}")
+    logger.add(pipeline, level="INFO", enqueue=False, format="{message}")
+    _pipeline = pipeline
@@ -1,35 +1,188 @@
 from __future__ import annotations
 
+import asyncio
+import random
+import socket
 import time
+from datetime import timedelta
 from typing import Optional
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from statsd import StatsClient
+from loguru import logger
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from .asgi import route_info
 from .config import AppConfig
 
-statsd_client: Optional[StatsClient] = None
+
+class BufferedStatsClient:
+    """StatsD client that aggregates metrics in process and flushes in batches.
+
+    Offers the ``incr``/``decr``/``gauge``/``timing`` API of
+    ``statsd.StatsClient`` but only records values in memory: counters are
+    summed, gauges keep their latest value and timings keep every sample.
+    :meth:`flush` packs the aggregate into newline-separated datagrams of at
+    most ``max_packet_size`` bytes; :meth:`run` flushes every
+    ``flush_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8125,
+        prefix: str | None = None,
+        flush_interval: float = 1.0,
+        max_packet_size: int = 1432,
+    ) -> None:
+        family, _, _, _, addr = socket.getaddrinfo(
+            host, port, socket.AF_UNSPEC, socket.SOCK_DGRAM
+        )[0]
+        self._addr = addr
+        self._sock = socket.socket(family, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._prefix = f"{prefix}." if prefix else ""
+        self._flush_interval = flush_interval
+        self._max_packet_size = max_packet_size
+        self._counters: dict[tuple[str, float], float] = {}
+        self._gauges: dict[str, tuple[float, bool]] = {}
+        self._timings: dict[tuple[str, float], list[float]] = {}
+
+    def incr(self, stat: str, count: float = 1, rate: float = 1) -> None:
+        if rate < 1 and random.random() > rate:
+            return
+        key = (stat, rate)
+        self._counters[key] = self._counters.get(key, 0) + count
+
+    def decr(self, stat: str, count: float = 1, rate: float = 1) -> None:
+        self.incr(stat, -count, rate)
+
+    def gauge(
+        self, stat: str, value: float, rate: float = 1, delta: bool = False
+    ) -> None:
+        if rate < 1 and random.random() > rate:
+            return
+        current = self._gauges.get(stat)
+        if delta and current is not None:
+            self._gauges[stat] = (current[0] + value, current[1])
+        else:
+            self._gauges[stat] = (value, delta)
+
+    def timing(self, stat: str, delta: float | timedelta, rate: float = 1) -> None:
+        if rate < 1 and random.random() > rate:
+            return
+        if isinstance(delta, timedelta):
+            delta = delta.total_seconds() * 1000.0
+        self._timings.setdefault((stat, rate), []).append(delta)
+
+    def flush(self) -> None:
+        """Send everything aggregated since the previous flush."""
+        lines = self._drain()
+        packet: list[bytes] = []
+        size = 0
+        for line in lines:
+            if packet and size + len(line) + 1 > self._max_packet_size:
+                self._send(b"\n".join(packet))
+                packet, size = [], 0
+            packet.append(line)
+            size += len(line) + 1
+        if packet:
+            self._send(b"\n".join(packet))
+
+    async def run(self) -> None:
+        """Flush on the configured interval until cancelled."""
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            self.flush()
+
+    def close(self) -> None:
+        """Flush pending metrics and close the socket."""
+        self.flush()
+        self._sock.close()
+
+    def _drain(self) -> list[bytes]:
+        counters, self._counters = self._counters, {}
+        gauges, self._gauges = self._gauges, {}
+        timings, self._timings = self._timings, {}
+        p = self._prefix
+        lines: list[bytes] = []
+        for (stat, rate), count in counters.items():
+            lines.append(f"{p}{stat}:{_fmt(count)}|c{_rate(rate)}".encode())
+        for stat, (value, is_delta) in gauges.items():
+            if is_delta:
+                sign = "+" if value >= 0 else ""
+                lines.append(f"{p}{stat}:{sign}{_fmt(value)}|g".encode())
+            else:
+                if value < 0:
+                    lines.append(f"{p}{stat}:0|g".encode())
+                lines.append(f"{p}{stat}:{_fmt(value)}|g".encode())
+        for (stat, rate), values in timings.items():
+            suffix = f"|ms{_rate(rate)}"
+            lines.extend(f"{p}{stat}:{_fmt(v)}{suffix}".encode() for v in values)
+        return lines
+
+    def _send(self, data: bytes) -> None:
+        try:
+            self._sock.sendto(data, self._addr)
+        except OSError as exc:
+            logger.debug(f"StatsD send failed: {exc}")
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if value == int(value) else f"{value:.3f}"
+
+
+def _rate(rate: float) -> str:
+    return f"|@{rate}" if rate < 1 else ""
+
+
+statsd_client: Optional[BufferedStatsClient] = None
 
 
 def init_metrics(config: AppConfig) -> None:
     """Initialize StatsD client from application config."""
     global statsd_client
-    statsd_client = StatsClient(
+    if statsd_client is not None:
+        statsd_client.close()
+    statsd_client = BufferedStatsClient(
         host=config.statsd_host,
         port=config.statsd_port,
         prefix=config.statsd_prefix,
+        flush_interval=config.statsd_flush_interval,
+        max_packet_size=config.statsd_max_packet_size,
     )
 
 
-class StatsDMiddleware(BaseHTTPMiddleware):
-    """Middleware that sends request metrics to StatsD."""
+class StatsDMiddleware:
+    """ASGI middleware that sends request metrics to StatsD.
+
+    Records the request count and duration overall, plus a status code
+    counter and a per-route duration keyed by the route name.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next):  # type: ignore[override]
         start = time.perf_counter()
-        response = await call_next(request)
-        if statsd_client is not None:
-            duration = int((time.perf_counter() - start) * 1000)
-            statsd_client.incr("request_count")
-            statsd_client.timing("request_duration", duration)
-        return response
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            client = statsd_client
+            if client is not None:
+                duration = int((time.perf_counter() - start) * 1000)
+                name, _ = route_info(scope)
+                client.incr(f"request_status.{status_code}")
+                client.timing(f"route.{name}.duration", duration)
+                client.timing("request_duration", duration)
+                client.incr("request_count")
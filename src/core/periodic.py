@@ -0,0 +1,26 @@
+"""Helpers for background housekeeping loops."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+
+async def run_periodic(
+    callback: Callable[[], Awaitable[None]],
+    interval: float,
+    shutdown_event: asyncio.Event,
+) -> None:
+    """Await ``callback`` every ``interval`` seconds until shutdown."""
+
+    while not shutdown_event.is_set():
+        try:
+            await callback()
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.error(f"Periodic task error: {exc}")
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
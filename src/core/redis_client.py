@@ -0,0 +1,55 @@
+"""Application-scoped Redis connection pool."""
+
+from __future__ import annotations
+
+import asyncio
+
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from . import metrics
+from .config import AppConfig
+from .periodic import run_periodic
+
+
+def create_redis(config: AppConfig) -> Redis:
+    """Return a Redis client backed by a bounded connection pool.
+
+    Connections are opened lazily, so the client can be created before the
+    event loop starts serving requests.
+    """
+
+    pool = BlockingConnectionPool.from_url(
+        config.redis_url,
+        max_connections=config.redis_max_connections,
+        timeout=config.redis_pool_timeout,
+        socket_timeout=config.redis_socket_timeout,
+        socket_connect_timeout=config.redis_socket_connect_timeout,
+        health_check_interval=config.redis_health_check_interval,
+    )
+    return Redis(connection_pool=pool)
+
+
+def report_pool_metrics(redis: Redis) -> None:
+    """Send connection pool saturation gauges to StatsD."""
+
+    if metrics.statsd_client is None:
+        return
+    pool = redis.connection_pool
+    in_use = len(pool._in_use_connections)  # type: ignore[attr-defined]
+    idle = len(pool._available_connections)  # type: ignore[attr-defined]
+    metrics.statsd_client.gauge("redis_pool_in_use", in_use)
+    metrics.statsd_client.gauge("redis_pool_idle", idle)
+    metrics.statsd_client.gauge(
+        "redis_pool_saturation", int(in_use * 100 / pool.max_connections)
+    )
+
+
+async def monitor_pool(
+    redis: Redis, interval: float, shutdown_event: asyncio.Event
+) -> None:
+    """Periodically report pool metrics until shutdown."""
+
+    async def _report() -> None:
+        report_pool_metrics(redis)
+
+    await run_periodic(_report, interval, shutdown_event)
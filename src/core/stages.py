@@ -0,0 +1,107 @@
+"""In-process latency histograms for hot-path stages.
+
+Stages record durations in nanoseconds from :func:`time.perf_counter_ns`::
+
+    start = time.perf_counter_ns()
+    ...
+    stages.record("redis.xadd", start)
+
+Each stage keeps an HDR-style log-linear histogram: values are bucketed by
+power of two and each power of two is split into 16 linear sub-buckets, so
+recording is a few integer operations and percentiles are accurate to
+about 6% over the whole range without storing samples.
+"""
+
+from __future__ import annotations
+
+import time
+
+_SUB_BITS = 5
+_SUB_COUNT = 1 << _SUB_BITS
+_HALF = _SUB_COUNT >> 1
+
+
+def _bucket(value: int) -> int:
+    if value < _SUB_COUNT:
+        return value
+    shift = value.bit_length() - _SUB_BITS
+    return _SUB_COUNT + (shift - 1) * _HALF + (value >> shift) - _HALF
+
+
+def _bucket_high(index: int) -> int:
+    """Return the largest value that falls into bucket ``index``."""
+    if index < _SUB_COUNT:
+        return index
+    shift, offset = divmod(index - _SUB_COUNT, _HALF)
+    shift += 1
+    return ((_HALF + offset + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Log-linear histogram of durations in microseconds."""
+
+    __slots__ = ("_counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self._counts: list[int] = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, micros: int) -> None:
+        """Add one duration of ``micros`` microseconds."""
+        index = _bucket(micros)
+        counts = self._counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.count += 1
+        self.total += micros
+        if micros > self.max:
+            self.max = micros
+
+    def percentile(self, fraction: float) -> int:
+        """Return the upper bound of the ``fraction`` percentile bucket."""
+        if not self.count:
+            return 0
+        target = max(1, round(fraction * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self._counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(_bucket_high(index), self.max)
+        return self.max
+
+    def summary(self) -> dict[str, float]:
+        """Return count, mean, percentiles and max in milliseconds."""
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": mean / 1000,
+            "p50_ms": self.percentile(0.5) / 1000,
+            "p90_ms": self.percentile(0.9) / 1000,
+            "p99_ms": self.percentile(0.99) / 1000,
+            "p999_ms": self.percentile(0.999) / 1000,
+            "max_ms": self.max / 1000,
+        }
+
+
+_histograms: dict[str, LatencyHistogram] = {}
+
+
+def record(stage: str, start_ns: int) -> None:
+    """Record the time since ``start_ns`` (``perf_counter_ns``) for ``stage``."""
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        histogram = _histograms[stage] = LatencyHistogram()
+    histogram.record((time.perf_counter_ns() - start_ns) // 1000)
+
+
+def snapshot() -> dict[str, dict[str, float]]:
+    """Return the summary of every stage, keyed by stage name."""
+    return {name: _histograms[name].summary() for name in sorted(_histograms)}
+
+
+def reset() -> None:
+    """Drop all recorded durations."""
+    _histograms.clear()
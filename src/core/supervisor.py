@@ -0,0 +1,161 @@
+"""Pre-fork process supervisor."""
+
+from __future__ import annotations
+
+import multiprocessing
+import signal
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable
+
+from loguru import logger
+
+_Slot = tuple[str, int]
+
+
+@dataclass(frozen=True)
+class WorkerSpec:
+    """``count`` processes of one role, each running ``target(*args)``."""
+
+    role: str
+    target: Callable[..., Any]
+    count: int
+    args: tuple[Any, ...] = ()
+
+
+def reuseport_socket(host: str, port: int) -> socket.socket:
+    """Return a socket bound with ``SO_REUSEPORT``.
+
+    Every worker binds its own listener on the same address and the kernel
+    spreads incoming connections across them.
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+class Supervisor:
+    """Run worker processes, restart the ones that die and drain on exit.
+
+    Workers are started fresh (``spawn``) so they do not inherit the
+    supervisor's threads. A worker that exits while the supervisor is
+    running is restarted; one that dies within ``min_uptime`` seconds of
+    starting is restarted after an exponential delay of ``restart_delay``
+    up to ``restart_delay_max`` seconds, so a crash loop does not spin.
+
+    On SIGTERM or SIGINT, or :meth:`stop`, every worker receives SIGTERM
+    and gets ``shutdown_timeout`` seconds to drain before it is killed.
+    """
+
+    def __init__(
+        self,
+        specs: list[WorkerSpec],
+        shutdown_timeout: float = 30.0,
+        restart_delay: float = 0.5,
+        restart_delay_max: float = 30.0,
+        min_uptime: float = 5.0,
+        start_method: str = "spawn",
+    ) -> None:
+        self._specs = {spec.role: spec for spec in specs}
+        self._shutdown_timeout = shutdown_timeout
+        self._restart_delay = restart_delay
+        self._restart_delay_max = restart_delay_max
+        self._min_uptime = min_uptime
+        self._context = multiprocessing.get_context(start_method)
+        self._workers: dict[_Slot, BaseProcess] = {}
+        self._started_at: dict[_Slot, float] = {}
+        self._failures: dict[_Slot, int] = {}
+        self._restart_at: dict[_Slot, float] = {}
+        self._stopping = threading.Event()
+
+    def run(self) -> int:
+        """Supervise workers until stopped; return the exit status."""
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda *_: self.stop())
+
+        for spec in self._specs.values():
+            for index in range(spec.count):
+                self._start((spec.role, index))
+        logger.info(
+            "Supervisor started "
+            + ", ".join(f"{s.count} {s.role}" for s in self._specs.values())
+        )
+
+        while not self._stopping.is_set():
+            self._restart_due()
+            sentinels = {
+                process.sentinel: slot for slot, process in self._workers.items()
+            }
+            for sentinel in wait(list(sentinels), timeout=self._wait_timeout()):
+                self._reap(sentinels[sentinel])
+        self._drain()
+        return 0
+
+    def stop(self) -> None:
+        """Ask :meth:`run` to drain the workers and return."""
+        self._stopping.set()
+
+    def _start(self, slot: _Slot) -> None:
+        spec = self._specs[slot[0]]
+        process = self._context.Process(
+            target=spec.target, args=spec.args, name=f"{slot[0]}-{slot[1]}"
+        )
+        process.start()
+        self._workers[slot] = process
+        self._started_at[slot] = time.monotonic()
+
+    def _reap(self, slot: _Slot) -> None:
+        process = self._workers.pop(slot)
+        process.join()
+        if self._stopping.is_set():
+            return
+        if time.monotonic() - self._started_at[slot] < self._min_uptime:
+            self._failures[slot] = self._failures.get(slot, 0) + 1
+        else:
+            self._failures[slot] = 0
+        delay = 0.0
+        if self._failures[slot]:
+            delay = min(
+                self._restart_delay_max,
+                self._restart_delay * 2 ** (self._failures[slot] - 1),
+            )
+        logger.error(
+            f"Worker {process.name} exited with {process.exitcode}; "
+            f"restarting in {delay:.1f}s"
+        )
+        self._restart_at[slot] = time.monotonic() + delay
+
+    def _restart_due(self) -> None:
+        now = time.monotonic()
+        for slot, due in list(self._restart_at.items()):
+            if due <= now:
+                del self._restart_at[slot]
+                self._start(slot)
+
+    def _wait_timeout(self) -> float:
+        if not self._restart_at:
+            return 1.0
+        return max(0.0, min(1.0, min(self._restart_at.values()) - time.monotonic()))
+
+    def _drain(self) -> None:
+        logger.info("Supervisor stopping workers")
+        for process in self._workers.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self._shutdown_timeout
+        for process in self._workers.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+        for process in self._workers.values():
+            if process.is_alive():
+                logger.error(f"Worker {process.name} did not stop; killing it")
+                process.kill()
+                process.join()
+        self._workers.clear()
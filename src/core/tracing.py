@@ -1,34 +1,122 @@
 from __future__ import annotations
 
+from typing import Mapping
+
+from opentelemetry import context as otel_context
 from opentelemetry import trace
+from opentelemetry.context import Context
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from opentelemetry.sdk.trace.sampling import (
+    ALWAYS_OFF,
+    ALWAYS_ON,
+    ParentBased,
+    Sampler,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 
+from .asgi import route_info
 from .config import AppConfig
 
 tracer = trace.get_tracer("service")
 
+_propagator = TraceContextTextMapPropagator()
+_PROPAGATION_HEADERS = (b"traceparent", b"tracestate")
+
+
+def make_sampler(name: str, ratio: float) -> Sampler:
+    """Return the head sampler called ``name``.
+
+    ``parentbased_*`` samplers follow the sampling decision of an incoming
+    ``traceparent`` and only decide for new root spans.
+    """
+    samplers = {
+        "always_on": lambda: ALWAYS_ON,
+        "always_off": lambda: ALWAYS_OFF,
+        "traceidratio": lambda: TraceIdRatioBased(ratio),
+        "parentbased_always_on": lambda: ParentBased(ALWAYS_ON),
+        "parentbased_traceidratio": lambda: ParentBased(TraceIdRatioBased(ratio)),
+    }
+    try:
+        return samplers[name]()
+    except KeyError:
+        raise ValueError(f"Unknown trace sampler: {name}") from None
+
 
 def configure_tracing(config: AppConfig) -> None:
     """Configure OpenTelemetry tracing with OTLP exporter."""
     exporter = OTLPSpanExporter(endpoint=config.jaeger_endpoint)
     provider = TracerProvider(
-        resource=Resource.create({"service.name": config.jaeger_service_name})
+        resource=Resource.create({"service.name": config.jaeger_service_name}),
+        sampler=make_sampler(config.trace_sampler, config.trace_sample_ratio),
     )
+    options = {
+        "max_queue_size": config.trace_max_queue_size,
+        "max_export_batch_size": config.trace_max_export_batch_size,
+        "schedule_delay_millis": config.trace_schedule_delay_ms,
+        "export_timeout_millis": config.trace_export_timeout_ms,
+    }
     try:
-        provider.add_span_processor(BatchSpanProcessor(exporter))
+        provider.add_span_processor(BatchSpanProcessor(exporter, **options))
     except Exception:
-        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+        provider.add_span_processor(
+            BatchSpanProcessor(ConsoleSpanExporter(), **options)
+        )
     trace.set_tracer_provider(provider)
 
 
-class TracingMiddleware(BaseHTTPMiddleware):
-    """Middleware creating a span for each HTTP request."""
+def extract_context(carrier: Mapping[str, str]) -> Context:
+    """Return the context described by W3C ``traceparent``/``tracestate``."""
+    return _propagator.extract(carrier)
+
+
+def inject_context() -> dict[str, str]:
+    """Return W3C propagation headers for the current span."""
+    carrier: dict[str, str] = {}
+    _propagator.inject(carrier)
+    return carrier
 
-    async def dispatch(self, request: Request, call_next):  # type: ignore[override]
+
+class TracingMiddleware:
+    """ASGI middleware creating a span for each HTTP request.
+
+    An incoming W3C ``traceparent`` header makes the request span a child of
+    the caller's span.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {
+            name.decode(): value.decode("latin-1")
+            for name, value in scope["headers"]
+            if name in _PROPAGATION_HEADERS
+        }
+        token = otel_context.attach(extract_context(carrier)) if carrier else None
+        try:
+            await self._traced(scope, receive, send)
+        finally:
+            if token is not None:
+                otel_context.detach(token)
+
+    async def _traced(self, scope: Scope, receive: Receive, send: Send) -> None:
         with tracer.start_as_current_span("api_request_span"):
-            return await call_next(request)
+            span = trace.get_current_span()
+
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+            span.set_attribute("http.method", scope["method"])
+            span.set_attribute("http.route", route_info(scope)[1])
@@ -1,5 +1,6 @@
 """Application entry point."""
 
+import multiprocessing
 from multiprocessing import cpu_count
 
 import os
@@ -12,19 +13,33 @@ from starlette.responses import JSONResponse, Response
 from starlette.routing import Route
 from starlette.requests import Request
 
+from dataclasses import asdict
 from datetime import datetime
-from redis.asyncio import Redis
+from types import FrameType
 from loguru import logger
 import asyncio
 import contextlib
 
 from core.config import AppConfig, configure_logging
+from core.debug import debug_metrics, debug_profile
+from core.health import HealthProbe
+from core.logging_config import get_log_pipeline
+from core import metrics
 from core.metrics import StatsDMiddleware, init_metrics
+from core.periodic import run_periodic
+from core.redis_client import create_redis, monitor_pool
+from core.supervisor import Supervisor, WorkerSpec, reuseport_socket
 from core.tracing import TracingMiddleware, configure_tracing, tracer
 from pydantic import BaseModel
-from tasks.api import create_task
+from tasks.lanes import lane_streams
+from tasks.api import create_task, create_tasks_batch, get_task
+from service.handlers import HandlerRegistry
 from service.task_processor import process_tasks
 from tasks.models import TaskMessage
+from tasks.repository import TaskRepository
+from tasks.serialization import get_codec
+from tasks.service import TaskService
+from tasks.status import TaskStatusStore
 
 
 class HealthResponse(BaseModel):
@@ -34,6 +49,11 @@ class HealthResponse(BaseModel):
     timestamp: str
     redis_connected: bool
     version: str
+    ping_ms: float | None = None
+    stream_length: int | None = None
+    consumer_lag: int | None = None
+    pending: int | None = None
+    lanes: dict[str, dict[str, int | None]] | None = None
 
 
 def create_app() -> Starlette:
@@ -43,62 +63,200 @@ def create_app() -> Starlette:
     configure_tracing(config)
 
     async def healthcheck(request: Request) -> JSONResponse:
-        """Return health information about the service."""
+        """Return the health snapshot kept by the background probe."""
 
-        redis_connected = False
-        try:
-            async with Redis.from_url(config.redis_url) as redis:
-                await redis.ping()
-                redis_connected = True
-        except Exception:
-            redis_connected = False
-
-        status = "healthy" if redis_connected else "unhealthy"
+        probe: HealthProbe | None = getattr(request.app.state, "health_probe", None)
+        snapshot = probe.snapshot if probe is not None else None
+        healthy = probe is not None and probe.healthy()
         response = HealthResponse(
-            status=status,
-            timestamp=datetime.utcnow().isoformat(),
-            redis_connected=redis_connected,
+            status="healthy" if healthy else "unhealthy",
+            timestamp=(
+                snapshot.timestamp if snapshot else datetime.utcnow().isoformat()
+            ),
+            redis_connected=healthy,
             version=config.service_version,
+            ping_ms=snapshot.ping_ms if snapshot else None,
+            stream_length=snapshot.stream_length if snapshot else None,
+            consumer_lag=snapshot.consumer_lag if snapshot else None,
+            pending=snapshot.pending if snapshot else None,
+            lanes=(
+                {lane: asdict(stats) for lane, stats in snapshot.lanes.items()}
+                if snapshot and snapshot.lanes
+                else None
+            ),
         )
-        status_code = 200 if redis_connected else 503
+        status_code = 200 if healthy else 503
         return JSONResponse(response.model_dump(), status_code=status_code)
 
+    async def liveness(request: Request) -> Response:
+        """Report that the process is serving requests."""
+
+        return Response(status_code=200)
+
+    async def readiness(request: Request) -> Response:
+        """Report whether the service should receive traffic.
+
+        Not ready once the worker has been told to stop, while it drains.
+        """
+
+        probe: HealthProbe | None = getattr(request.app.state, "health_probe", None)
+        draining = getattr(request.app.state, "draining", False)
+        ready = (
+            probe is not None
+            and probe.healthy()
+            and not draining
+            and not shutdown_event.is_set()
+        )
+        return Response(status_code=200 if ready else 503)
+
     async def tasks(request: Request) -> Response:
         return await create_task(request, config)
 
+    async def task_status(request: Request) -> Response:
+        return await get_task(request, config)
+
+    async def tasks_batch(request: Request) -> Response:
+        return await create_tasks_batch(request, config)
+
+    async def stage_metrics(request: Request) -> Response:
+        return await debug_metrics(request, config)
+
+    async def profile(request: Request) -> Response:
+        return await debug_profile(request, config)
+
     middleware = [
         Middleware(StatsDMiddleware),
         Middleware(TracingMiddleware),
     ]
 
-    return Starlette(
-        routes=[
-            Route("/health", healthcheck, methods=["GET"]),
-            Route("/tasks", tasks, methods=["POST"]),
-        ],
-        middleware=middleware,
-    )
+    routes = [
+        Route("/health", healthcheck, methods=["GET"]),
+        Route("/health/live", liveness, methods=["GET"]),
+        Route("/health/ready", readiness, methods=["GET"]),
+        Route("/tasks", tasks, methods=["POST"]),
+        Route("/tasks/batch", tasks_batch, methods=["POST"]),
+        Route("/tasks/{task_id}", task_status, methods=["GET"]),
+    ]
+    if config.debug_token:
+        # Without a token the debug endpoints are not served at all.
+        routes += [
+            Route("/debug/metrics", stage_metrics, methods=["GET"]),
+            Route("/debug/profile", profile, methods=["POST"]),
+        ]
 
+    return Starlette(routes=routes, middleware=middleware)
 
+
+# Logging is set up by the process that serves or supervises, not on import:
+# handler pool processes import this module too and must not open the log file.
 config = AppConfig()
-configure_logging()
 app = create_app()
 
 shutdown_event = asyncio.Event()
+handlers = HandlerRegistry(
+    thread_workers=config.handler_thread_workers,
+    process_workers=config.handler_process_workers or None,
+)
 
 
+@handlers.register(None)
 async def _log_task(message: TaskMessage) -> None:
-    """Default task handler that logs the task."""
+    """Default handler for tasks without a ``type``; logs the task."""
 
     logger.bind(task_id=message.task_id, trace_id=message.trace_context.trace_id).info(
         "processed"
     )
 
 
+@app.on_event("startup")
+async def _start_metrics() -> None:
+    if get_log_pipeline() is None:
+        # Served without the supervisor, e.g. by ``uvicorn main:app``.
+        configure_logging(config)
+    if metrics.statsd_client is not None:
+        app.state.metrics_task = asyncio.create_task(metrics.statsd_client.run())
+    pipeline = get_log_pipeline()
+    if pipeline is not None:
+        app.state.log_drops_task = asyncio.create_task(
+            run_periodic(
+                pipeline.report_dropped, config.statsd_flush_interval, shutdown_event
+            )
+        )
+
+
+@app.on_event("startup")
+async def _open_redis() -> None:
+    app.state.redis = create_redis(config)
+    repo = TaskRepository(
+        app.state.redis,
+        config.redis_stream_name,
+        batch_size=config.enqueue_batch_size,
+        batch_window=config.enqueue_batch_window,
+        codec=get_codec(config.task_wire_format),
+        maxlen=config.stream_maxlen,
+        retention=config.stream_retention_seconds,
+        approximate=config.stream_trim_approximate,
+        trim_on_add=config.stream_trim_interval <= 0,
+        lanes=lane_streams(config),
+    )
+    app.state.task_repository = repo
+    app.state.task_service = TaskService(
+        repo,
+        idempotency_ttl=config.idempotency_ttl,
+        idempotency_cache_size=config.idempotency_cache_size,
+    )
+    app.state.task_status = TaskStatusStore(
+        app.state.redis,
+        config.redis_stream_name,
+        config.task_status_ttl,
+        cache_ttl=config.task_status_cache_ttl,
+        cache_size=config.task_status_cache_size,
+    )
+    probe = HealthProbe(
+        app.state.redis,
+        config.redis_stream_name,
+        config.redis_consumer_group,
+        stale_after=config.health_probe_interval * 3,
+        stream_stats=config.background_jobs,
+        lanes=lane_streams(config),
+    )
+    app.state.health_probe = probe
+    app.state.background_tasks = [
+        asyncio.create_task(
+            run_periodic(probe.probe, config.health_probe_interval, shutdown_event)
+        ),
+        asyncio.create_task(
+            monitor_pool(
+                app.state.redis, config.redis_pool_metrics_interval, shutdown_event
+            )
+        ),
+    ]
+    if not config.background_jobs:
+        return
+    app.state.background_tasks.append(
+        asyncio.create_task(
+            run_periodic(
+                repo.sample_queue_size,
+                config.queue_size_sample_interval,
+                shutdown_event,
+            )
+        )
+    )
+    if config.stream_trim_interval > 0:
+        app.state.background_tasks.append(
+            asyncio.create_task(
+                run_periodic(repo.trim, config.stream_trim_interval, shutdown_event)
+            )
+        )
+
+
 @app.on_event("startup")
 async def _start_processor() -> None:
+    if config.service_role == "api":
+        app.state.processor_task = None
+        return
     app.state.processor_task = asyncio.create_task(
-        process_tasks(config, _log_task, shutdown_event)
+        process_tasks(config, handlers, shutdown_event, app.state.redis)
     )
 
 
@@ -106,10 +264,36 @@ async def _start_processor() -> None:
 async def _stop_processor() -> None:
     logger.info("graceful shutdown")
     shutdown_event.set()
-    try:
-        await asyncio.wait_for(app.state.processor_task, config.shutdown_timeout)
-    except asyncio.TimeoutError:
-        os.kill(os.getpid(), signal.SIGKILL)
+    if app.state.processor_task is not None:
+        try:
+            await asyncio.wait_for(app.state.processor_task, config.shutdown_timeout)
+        except asyncio.TimeoutError:
+            os.kill(os.getpid(), signal.SIGKILL)
+    handlers.shutdown()
+
+
+@app.on_event("shutdown")
+async def _close_redis() -> None:
+    for task in app.state.background_tasks:
+        task.cancel()
+    for task in app.state.background_tasks:
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await app.state.task_repository.close()
+    await app.state.task_status.close()
+    await app.state.redis.aclose()
+
+
+@app.on_event("shutdown")
+async def _stop_metrics() -> None:
+    for name in ("log_drops_task", "metrics_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+    if metrics.statsd_client is not None:
+        metrics.statsd_client.flush()
 
 
 def _get_workers(cfg: AppConfig) -> int:
@@ -118,28 +302,113 @@ def _get_workers(cfg: AppConfig) -> int:
     return cpu_count() if cfg.worker_processes == "auto" else int(cfg.worker_processes)
 
 
-if __name__ == "__main__":
-    loop_type = "uvloop" if config.uvloop_enabled else "asyncio"
+def _worker_log_path(path: str, worker: str) -> str:
+    """Return ``path`` with the worker's name inserted before the suffix."""
+
+    root, suffix = os.path.splitext(path)
+    return f"{root}.{worker}{suffix}"
+
+
+def _background_worker(cfg: AppConfig) -> str:
+    """Return the name of the worker that runs the stream-wide jobs.
+
+    That is the first HTTP worker, or the first consumer when there are
+    no HTTP workers.
+    """
+
+    return "http-0" if _get_workers(cfg) > 0 else "consumer-0"
+
+
+def _configure_worker(role: str) -> None:
+    """Set up a spawned worker process before it starts serving.
+
+    Each worker logs to its own file, named after the worker (``http-0``,
+    ``consumer-1``, ...) so rotation stays per process and survives
+    restarts. Only one worker (see :func:`_background_worker`) runs the
+    stream-wide background jobs: queue size sampling, trimming and the
+    health probe's stream statistics.
+    """
+
+    name = multiprocessing.current_process().name
+    config.service_role = role
+    config.background_jobs = name == _background_worker(config)
+    if config.log_file_path:
+        config.log_file_path = _worker_log_path(config.log_file_path, name)
+    configure_logging(config)
+
+
+class _DrainingServer(uvicorn.Server):
+    """uvicorn server that marks the app as draining when told to stop."""
 
-    async def _serve() -> None:
-        config_uvicorn = uvicorn.Config(
-            "main:app",
+    def handle_exit(self, sig: int, frame: FrameType | None) -> None:
+        app.state.draining = True
+        super().handle_exit(sig, frame)
+
+
+def _run_http_worker(role: str) -> None:
+    """Serve HTTP on a ``SO_REUSEPORT`` listener until SIGTERM.
+
+    uvicorn drains open connections and then runs the shutdown handlers.
+    """
+
+    _configure_worker(role)
+    sock = reuseport_socket(config.service_host, config.service_port)
+    server = _DrainingServer(
+        uvicorn.Config(
+            app,
             host=config.service_host,
             port=config.service_port,
-            loop=loop_type,
-            workers=_get_workers(config),
+            loop="uvloop" if config.uvloop_enabled else "asyncio",
         )
-        server = uvicorn.Server(config_uvicorn)
-
-        loop = asyncio.get_running_loop()
+    )
+    # uvicorn re-raises the signal that stopped it once serving is done.
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if config.uvloop_enabled:
+        uvloop.install()
+    asyncio.run(server.serve(sockets=[sock]))
 
-        def _sigterm_handler() -> None:
-            shutdown_event.set()
-            server.handle_exit(signal.SIGTERM, None)
 
-        loop.add_signal_handler(signal.SIGTERM, _sigterm_handler)
-        await server.serve()
+def _run_consumer_worker() -> None:
+    """Process tasks without serving HTTP until SIGTERM."""
 
+    _configure_worker("consumer")
     if config.uvloop_enabled:
         uvloop.install()
-    asyncio.run(_serve())
+    asyncio.run(_consume())
+
+
+async def _consume() -> None:
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await app.router.startup()
+    try:
+        stopped = asyncio.create_task(stop.wait())
+        await asyncio.wait(
+            [stopped, app.state.processor_task], return_when=asyncio.FIRST_COMPLETED
+        )
+        stopped.cancel()
+    finally:
+        await app.router.shutdown()
+    if not stop.is_set():
+        # The processor died on its own; let the supervisor restart us.
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    configure_logging(config)
+    consumers = config.consumer_processes
+    supervisor = Supervisor(
+        [
+            WorkerSpec(
+                "http",
+                _run_http_worker,
+                _get_workers(config),
+                ("api" if consumers else "all",),
+            ),
+            WorkerSpec("consumer", _run_consumer_worker, consumers),
+        ],
+        shutdown_timeout=config.shutdown_timeout + 5,
+    )
+    raise SystemExit(supervisor.run())
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from loguru import logger
+from redis.asyncio import Redis
+
+from core import metrics, stages
+from tasks.models import TaskStatus
+from tasks.status import TaskStatusStore
+
+
+class AckBuffer:
+    """Collect processed entry IDs and acknowledge them in pipelined batches.
+
+    Each flush sends a single ``XACK`` and ``XDEL`` carrying every buffered ID
+    in one round trip. Flushes happen when ``max_size`` IDs are buffered, every
+    ``flush_interval`` seconds while :meth:`run` is active, and on demand.
+
+    With a :class:`TaskStatusStore` the status passed with an ID is written
+    in the same flush, so recording it costs no extra round trip.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream: str,
+        group: str,
+        max_size: int = 100,
+        flush_interval: float = 0.05,
+        statuses: TaskStatusStore | None = None,
+    ) -> None:
+        self._redis = redis
+        self._stream = stream
+        self._group = group
+        self._max_size = max(1, max_size)
+        self._flush_interval = flush_interval
+        self._pending: list[bytes] = []
+        self._statuses = statuses
+        self._updates: list[TaskStatus] = []
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def tracks_status(self) -> bool:
+        """Whether statuses passed to :meth:`add` are recorded."""
+        return self._statuses is not None
+
+    async def add(self, message_id: bytes, status: TaskStatus | None = None) -> None:
+        """Buffer ``message_id`` and flush if the size threshold is reached.
+
+        ``status`` is recorded with the acknowledgement if status tracking
+        is enabled.
+        """
+
+        self._pending.append(message_id)
+        if status is not None and self._statuses is not None:
+            self._updates.append(status)
+        if len(self._pending) >= self._max_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Acknowledge and delete all buffered IDs."""
+
+        if not self._pending:
+            return
+        ids, self._pending = self._pending, []
+        updates, self._updates = self._updates, []
+        start = time.perf_counter_ns()
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.xack(self._stream, self._group, *ids)
+        pipe.xdel(self._stream, *ids)
+        try:
+            if updates and self._statuses is not None:
+                await self._statuses.record(pipe, updates)
+            await pipe.execute()
+        except asyncio.CancelledError:
+            self._pending[:0] = ids
+            self._updates[:0] = updates
+            raise
+        except Exception as exc:
+            logger.error(f"Ack flush failed: {exc}")
+            # Entries stay pending in Redis; keep them for the next flush.
+            self._pending[:0] = ids
+            self._updates[:0] = updates
+            return
+        stages.record("consumer.ack_flush", start)
+        if metrics.statsd_client is not None:
+            elapsed = (time.perf_counter_ns() - start) // 1_000_000
+            metrics.statsd_client.gauge("ack_flush_size", len(ids))
+            metrics.statsd_client.timing("ack_flush_latency", elapsed)
+
+    async def run(self) -> None:
+        """Flush on the configured interval until cancelled."""
+
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush()
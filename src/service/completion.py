@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from redis.asyncio import Redis
+
+
+class CompletionLog:
+    """Remember completed task IDs for ``ttl`` seconds.
+
+    Each completed task sets ``{stream}:done:{task_id}`` before its entry is
+    acknowledged. An entry redelivered after a crash between the two steps
+    is then recognised and acknowledged without running the handler again.
+    """
+
+    def __init__(self, redis: Redis, stream: str, ttl: int) -> None:
+        self._redis = redis
+        self._prefix = f"{stream}:done:"
+        self._ttl = ttl
+
+    async def mark(self, task_id: str) -> None:
+        """Record ``task_id`` as completed."""
+        await self._redis.set(self._prefix + task_id, 1, ex=self._ttl)
+
+    async def done(self, task_id: str) -> bool:
+        """Return whether ``task_id`` completed within the TTL."""
+        return bool(await self._redis.exists(self._prefix + task_id))
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+
+from loguru import logger
+from redis.asyncio import Redis
+
+from core.config import AppConfig
+
+_NONCE = uuid.uuid4().hex[:8]
+
+
+def resolve_consumer_name(config: AppConfig) -> str:
+    """Return the consumer name for this process.
+
+    An explicit ``redis_consumer_name`` wins; otherwise the name is built
+    from host name, pid and a per-process nonce so every worker process
+    joins the group as a distinct consumer.
+    """
+    if config.redis_consumer_name:
+        return config.redis_consumer_name
+    return f"{socket.gethostname()}-{os.getpid()}-{_NONCE}"
+
+
+class ConsumerRegistry:
+    """Group membership and heartbeats for one consumer.
+
+    Live consumers record a heartbeat in the ``{stream}:consumers:{group}``
+    hash. Consumers without a heartbeat newer than ``ttl`` seconds that
+    have also been idle in the group for ``ttl`` seconds and hold no
+    pending entries are removed from the group; the idle time spares a
+    consumer that has joined but not yet sent its first heartbeat. Those
+    that still hold entries are left for the reclaimer to drain first.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream: str,
+        group: str,
+        consumer: str,
+        heartbeat_interval: float = 10.0,
+        ttl: float = 60.0,
+    ) -> None:
+        self._redis = redis
+        self._stream = stream
+        self._group = group
+        self._consumer = consumer
+        self._heartbeat_interval = heartbeat_interval
+        self._ttl = ttl
+        self._key = f"{stream}:consumers:{group}"
+
+    async def register(self) -> None:
+        """Join the consumer group and record the first heartbeat."""
+        await self._redis.xgroup_createconsumer(
+            self._stream, self._group, self._consumer
+        )
+        await self.heartbeat()
+        logger.info(f"Registered consumer {self._consumer}")
+
+    async def heartbeat(self) -> None:
+        """Refresh this consumer's heartbeat."""
+        await self._redis.hset(self._key, self._consumer, int(time.time() * 1000))
+
+    async def live_consumers(self) -> list[str]:
+        """Return consumers with a heartbeat newer than the TTL."""
+        cutoff = (time.time() - self._ttl) * 1000
+        beats = await self._redis.hgetall(self._key)
+        return [_decode(name) for name, beat in beats.items() if int(beat) >= cutoff]
+
+    async def prune(self) -> None:
+        """Remove dead consumers that no longer own pending entries."""
+        live = set(await self.live_consumers())
+        for info in await self._redis.xinfo_consumers(self._stream, self._group):
+            name = _decode(info["name"])
+            if name in live or int(info["pending"]):
+                continue
+            if int(info["idle"]) < self._ttl * 1000:
+                continue
+            await self._redis.xgroup_delconsumer(self._stream, self._group, name)
+            await self._redis.hdel(self._key, name)
+            logger.info(f"Removed dead consumer {name}")
+
+    async def deregister(self) -> None:
+        """Leave the group unless entries are still pending for this consumer.
+
+        ``XGROUP DELCONSUMER`` discards the consumer's pending entries, so a
+        consumer with pending entries stays in the group to be reclaimed.
+        """
+        try:
+            await self._redis.hdel(self._key, self._consumer)
+            for info in await self._redis.xinfo_consumers(self._stream, self._group):
+                if _decode(info["name"]) == self._consumer and int(info["pending"]):
+                    logger.info(f"Consumer {self._consumer} left with pending tasks")
+                    return
+            await self._redis.xgroup_delconsumer(
+                self._stream, self._group, self._consumer
+            )
+            logger.info(f"Deregistered consumer {self._consumer}")
+        except Exception as exc:
+            logger.error(f"Consumer deregistration failed: {exc}")
+
+    async def run(self) -> None:
+        """Send heartbeats and prune dead consumers until cancelled."""
+        while True:
+            await asyncio.sleep(self._heartbeat_interval)
+            try:
+                await self.heartbeat()
+                await self.prune()
+            except Exception as exc:
+                logger.error(f"Consumer heartbeat failed: {exc}")
+
+
+def _decode(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from tasks.models import TaskMessage
+from .retry import RetryPolicy
+
+AsyncHandler = Callable[[TaskMessage], Awaitable[Any]]
+SyncHandler = Callable[[TaskMessage], Any]
+
+_EXECUTORS = ("thread", "process")
+
+
+@dataclass(frozen=True)
+class TaskHandler:
+    """A registered handler and the limits it runs under.
+
+    ``None`` settings fall back to the processor-wide defaults. With an
+    ``executor`` the handler is a plain function run off the event loop.
+    """
+
+    handler: Any
+    concurrency: int | None = None
+    timeout: float | None = None
+    retry: RetryPolicy | None = None
+    executor: str | None = None
+
+
+class HandlerRegistry:
+    """Route tasks to handlers by the ``type`` key of the payload metadata.
+
+    Handlers are registered per type, or for ``None`` to receive tasks
+    without a type. ``fallback`` receives tasks of any other type; without
+    it such tasks have no handler and are dead-lettered by the processor.
+
+    A type registered with ``concurrency`` runs at most that many handlers
+    at once. Further tasks of the type wait for a slot without holding one
+    of the processor's ``max_concurrent_tasks`` slots; :attr:`waiting`
+    counts them so the processor can bound that backlog. Once as many tasks
+    of a type wait as may run, :attr:`saturated` is true and the processor
+    stops reading, so read entries do not sit idle long enough to be
+    reclaimed.
+
+    CPU-bound handlers are registered with ``executor="thread"`` or
+    ``executor="process"`` and are then synchronous functions. Thread
+    handlers receive the decoded message and run in the current trace
+    context. Process handlers must be picklable (module level) and are sent
+    the already decoded message, pickled. Pool processes are started by a
+    ``forkserver``, never forked from the event loop process. Timeouts stop
+    waiting for an offloaded handler but cannot interrupt it.
+
+    A handler's return value is the task's result; for process handlers it
+    must be picklable.
+    """
+
+    def __init__(
+        self,
+        fallback: AsyncHandler | None = None,
+        type_key: str = "type",
+        thread_workers: int | None = None,
+        process_workers: int | None = None,
+    ) -> None:
+        self._fallback = TaskHandler(fallback) if fallback is not None else None
+        self._type_key = type_key
+        self._handlers: dict[str | None, TaskHandler] = {}
+        self._slots: dict[str | None, asyncio.Semaphore] = {}
+        self._limits: dict[str | None, int] = {}
+        self._waiting: dict[str | None, int] = {}
+        self._workers = {"thread": thread_workers, "process": process_workers}
+        self._executors: dict[str, Executor] = {}
+        self.waiting = 0
+
+    def register(
+        self,
+        task_type: str | None,
+        *,
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        retry: RetryPolicy | None = None,
+        executor: str | None = None,
+    ) -> Callable[[Any], Any]:
+        """Decorator registering the handler for ``task_type``."""
+
+        def decorator(handler: Any) -> Any:
+            self.add(
+                task_type,
+                handler,
+                concurrency=concurrency,
+                timeout=timeout,
+                retry=retry,
+                executor=executor,
+            )
+            return handler
+
+        return decorator
+
+    def add(
+        self,
+        task_type: str | None,
+        handler: AsyncHandler | SyncHandler,
+        *,
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        retry: RetryPolicy | None = None,
+        executor: str | None = None,
+    ) -> None:
+        """Register ``handler`` for ``task_type``, replacing any previous one."""
+        if executor is not None and executor not in _EXECUTORS:
+            raise ValueError(f"Unknown handler executor: {executor}")
+        self._handlers[task_type] = TaskHandler(
+            handler, concurrency, timeout, retry, executor
+        )
+        self._slots.pop(task_type, None)
+        self._limits.pop(task_type, None)
+        if concurrency is not None:
+            self._limits[task_type] = max(1, concurrency)
+            self._slots[task_type] = asyncio.Semaphore(self._limits[task_type])
+
+    def task_type(self, task: TaskMessage) -> str | None:
+        """Return the task's type, or ``None`` if it has none."""
+        task_type = task.payload.metadata.get(self._type_key)
+        return task_type if isinstance(task_type, str) else None
+
+    def resolve(self, task: TaskMessage) -> TaskHandler | None:
+        """Return the handler for ``task``, or ``None`` if there is none."""
+        return self._handlers.get(self.task_type(task), self._fallback)
+
+    @property
+    def saturated(self) -> bool:
+        """Whether some type has as many tasks waiting as it may run."""
+        return any(
+            waiting >= self._limits[task_type]
+            for task_type, waiting in self._waiting.items()
+        )
+
+    @contextlib.asynccontextmanager
+    async def slot(self, task: TaskMessage) -> AsyncIterator[bool]:
+        """Hold one of the concurrency slots of the task's type.
+
+        Yields whether the task had to wait for the slot.
+        """
+        task_type = self.task_type(task)
+        semaphore = self._slots.get(task_type) if task_type in self._handlers else None
+        if semaphore is None:
+            yield False
+            return
+        waited = semaphore.locked()
+        self.waiting += 1
+        self._waiting[task_type] = self._waiting.get(task_type, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            self._waiting[task_type] -= 1
+            if not self._waiting[task_type]:
+                del self._waiting[task_type]
+        try:
+            yield waited
+        finally:
+            semaphore.release()
+
+    async def call(self, spec: TaskHandler, task: TaskMessage) -> Any:
+        """Run ``spec``'s handler for ``task`` and return its result."""
+        if spec.executor is None:
+            return await spec.handler(task)
+        loop = asyncio.get_running_loop()
+        executor = self._executor(spec.executor)
+        if spec.executor == "thread":
+            context = contextvars.copy_context()
+            call = functools.partial(context.run, spec.handler, task)
+        else:
+            call = functools.partial(spec.handler, task)
+        return await loop.run_in_executor(executor, call)
+
+    def shutdown(self) -> None:
+        """Shut down the handler pools without waiting for running work."""
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
+
+    def _executor(self, kind: str) -> Executor:
+        executor = self._executors.get(kind)
+        if executor is None:
+            if kind == "thread":
+                executor = ThreadPoolExecutor(max_workers=self._workers[kind])
+            else:
+                # Forking this process, which runs the log writer and metrics
+                # threads, could copy a lock held by one of them into the child.
+                executor = ProcessPoolExecutor(
+                    max_workers=self._workers[kind],
+                    mp_context=multiprocessing.get_context("forkserver"),
+                )
+            self._executors[kind] = executor
+        return executor
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import time
+
+from loguru import logger
+from redis.asyncio import Redis
+
+from core import metrics
+
+Entry = tuple[bytes, dict[bytes, bytes]]
+
+
+class PendingReclaimer:
+    """Take over entries left pending by crashed or stuck consumers.
+
+    Every ``interval`` seconds :meth:`reclaim` runs ``XAUTOCLAIM`` for entries
+    idle longer than ``min_idle_ms``, walking the pending entries list with a
+    cursor across calls. Delivery counts of claimed entries are read from
+    ``XPENDING`` so the caller can stop redelivering poison messages.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream: str,
+        group: str,
+        consumer: str,
+        interval: float = 30.0,
+        min_idle_ms: int = 60000,
+        batch_size: int = 100,
+    ) -> None:
+        self._redis = redis
+        self._stream = stream
+        self._group = group
+        self._consumer = consumer
+        self._interval = interval
+        self._min_idle_ms = min_idle_ms
+        self._batch_size = max(1, batch_size)
+        self._cursor: bytes | str = "0-0"
+        self._last_run = float("-inf")
+
+    def due(self) -> bool:
+        """Return whether the reclaim interval has elapsed."""
+        return time.monotonic() - self._last_run >= self._interval
+
+    async def reclaim(self, limit: int) -> list[tuple[bytes, dict[bytes, bytes], int]]:
+        """Claim up to ``limit`` idle entries for this consumer.
+
+        Returns ``(message_id, fields, times_delivered)`` tuples. Errors are
+        logged and yield an empty batch so the consumer keeps running.
+        """
+        self._last_run = time.monotonic()
+        try:
+            cursor, claimed, *_ = await self._redis.xautoclaim(
+                self._stream,
+                self._group,
+                self._consumer,
+                min_idle_time=self._min_idle_ms,
+                start_id=self._cursor,
+                count=min(self._batch_size, max(1, limit)),
+            )
+            self._cursor = cursor
+            entries: list[Entry] = [
+                (message_id, fields) for message_id, fields in claimed if fields
+            ]
+            deliveries = await self._delivery_counts(entries)
+            await self._report(len(entries))
+        except Exception as exc:
+            logger.error(f"Reclaim failed: {exc}")
+            return []
+        if entries:
+            logger.info(f"Reclaimed {len(entries)} pending tasks")
+        return [
+            (message_id, fields, deliveries.get(message_id, 1))
+            for message_id, fields in entries
+        ]
+
+    async def touch(self, message_id: bytes) -> None:
+        """Reset the idle time of an entry this consumer is about to run.
+
+        Uses ``XCLAIM ... JUSTID``, which does not count as a delivery.
+        Errors are logged; the entry then just keeps its idle time.
+        """
+        try:
+            await self._redis.xclaim(
+                self._stream,
+                self._group,
+                self._consumer,
+                0,
+                [message_id],
+                justid=True,
+            )
+        except Exception as exc:
+            logger.error(f"Failed to reset idle time of {message_id!r}: {exc}")
+
+    async def _delivery_counts(self, entries: list[Entry]) -> dict[bytes, int]:
+        # Other entries held by this consumer may interleave with the claimed
+        # ones, so page through the ID range until every claimed ID is seen.
+        wanted = {message_id for message_id, _ in entries}
+        counts: dict[bytes, int] = {}
+        start: bytes | str = entries[0][0] if entries else b""
+        while wanted:
+            page = await self._redis.xpending_range(
+                self._stream,
+                self._group,
+                min=start,
+                max=entries[-1][0],
+                count=len(entries),
+                consumername=self._consumer,
+            )
+            for item in page:
+                if item["message_id"] in wanted:
+                    wanted.discard(item["message_id"])
+                    counts[item["message_id"]] = int(item["times_delivered"])
+            if len(page) < len(entries):
+                break
+            start = b"(" + page[-1]["message_id"]
+        return counts
+
+    async def _report(self, reclaimed: int) -> None:
+        if metrics.statsd_client is None:
+            return
+        summary = await self._redis.xpending(self._stream, self._group)
+        metrics.statsd_client.gauge("pel_size", int(summary["pending"]))
+        if reclaimed:
+            metrics.statsd_client.incr("tasks_reclaimed", reclaimed)
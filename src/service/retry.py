@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+import msgspec
+from loguru import logger
+from redis.asyncio import Redis
+
+from core import metrics
+from tasks.repository import trim_args, xadd_trim_tokens
+
+# Atomically move due retries back onto the stream. Members are msgpack maps
+# holding the original entry fields, so nothing is lost between ZREM and XADD.
+# ARGV[3..] are the XADD trim arguments, if any.
+_PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local args = {KEYS[2]}
+for i = 3, #ARGV do
+    args[#args + 1] = ARGV[i]
+end
+local n = #args
+for _, member in ipairs(due) do
+    local entry = cmsgpack.unpack(member)
+    args[n + 1] = '*'
+    args[n + 2] = 'task'
+    args[n + 3] = entry['task']
+    args[n + 4] = 'format'
+    args[n + 5] = entry['format']
+    args[n + 6] = 'attempts'
+    args[n + 7] = entry['attempts']
+    redis.call('XADD', unpack(args))
+    redis.call('ZREM', KEYS[1], member)
+end
+return #due
+"""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with a cap on the number of attempts."""
+
+    max_attempts: int = 3
+    backoff_base: float = 0.1
+    backoff_factor: float = 2.0
+    backoff_max: float = 60.0
+
+    def delay(self, attempts: int) -> float:
+        """Return the delay in seconds before retry number ``attempts``."""
+        return min(
+            self.backoff_max, self.backoff_base * self.backoff_factor ** (attempts - 1)
+        )
+
+
+class _RetryEntry(msgspec.Struct):
+    task: bytes
+    format: str
+    attempts: int
+    error: str
+    source_id: bytes
+
+
+class RetryScheduler:
+    """Delay failed tasks without blocking the consumer.
+
+    Failed entries are stored in the ``retry_key`` sorted set scored by the
+    time they become due, and :meth:`run` moves due entries back onto the
+    stream with an incremented ``attempts`` field. Entries that reach the
+    policy's attempt limit, or cannot be decoded, are appended to the
+    ``dead_letter_stream`` with the error and attempt count instead.
+
+    Promoted entries trim the stream as :class:`~tasks.repository.TaskRepository`
+    does given the same ``maxlen``, ``retention``, ``approximate`` and
+    ``trim_on_add``; the dead-letter stream is capped at ``maxlen`` entries.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream: str,
+        retry_key: str,
+        dead_letter_stream: str,
+        policy: RetryPolicy | None = None,
+        poll_interval: float = 0.5,
+        batch_size: int = 100,
+        maxlen: int = 100000,
+        retention: float = 0.0,
+        approximate: bool = True,
+        trim_on_add: bool = True,
+    ) -> None:
+        self._redis = redis
+        self._stream = stream
+        self._retry_key = retry_key
+        self._dead_letter_stream = dead_letter_stream
+        self._policy = policy or RetryPolicy()
+        self._poll_interval = poll_interval
+        self._batch_size = batch_size
+        self._maxlen = maxlen
+        self._retention = retention
+        self._approximate = approximate
+        self._trim_on_add = trim_on_add
+        self._encoder = msgspec.msgpack.Encoder()
+        self._promote_script = None
+
+    @property
+    def policy(self) -> RetryPolicy:
+        """The policy used for handlers without their own."""
+        return self._policy
+
+    async def fail(
+        self,
+        message_id: bytes,
+        fields: dict[bytes, bytes],
+        error: str,
+        policy: RetryPolicy | None = None,
+    ) -> None:
+        """Schedule a retry for a failed entry or dead-letter it."""
+        policy = policy or self._policy
+        attempts = int(fields.get(b"attempts", 0)) + 1
+        if attempts >= policy.max_attempts:
+            await self.dead_letter(message_id, fields, error, attempts)
+            return
+        entry = _RetryEntry(
+            task=fields.get(b"task", b""),
+            format=fields.get(b"format", b"json").decode(),
+            attempts=attempts,
+            error=error,
+            source_id=message_id,
+        )
+        due = time.time() + policy.delay(attempts)
+        await self._redis.zadd(
+            self._retry_key, {self._encoder.encode(entry): int(due * 1000)}
+        )
+        if metrics.statsd_client is not None:
+            metrics.statsd_client.incr("tasks_retried")
+
+    async def dead_letter(
+        self,
+        message_id: bytes,
+        fields: dict[bytes, bytes],
+        error: str,
+        attempts: int,
+    ) -> None:
+        """Append an entry to the dead-letter stream."""
+        await self._redis.xadd(
+            self._dead_letter_stream,
+            {
+                "task": fields.get(b"task", b""),
+                "format": fields.get(b"format", b"json"),
+                "attempts": attempts,
+                "error": error,
+                "source_id": message_id,
+                "failed_at": int(time.time() * 1000),
+            },
+            maxlen=self._maxlen,
+        )
+        logger.error(f"Task {message_id!r} dead-lettered after {attempts} attempts")
+        if metrics.statsd_client is not None:
+            metrics.statsd_client.incr("tasks_dead_lettered")
+
+    async def promote(self) -> int:
+        """Move due retries back onto the stream; return how many moved."""
+        if self._promote_script is None:
+            self._promote_script = self._redis.register_script(_PROMOTE_SCRIPT)
+        trim = (
+            trim_args(self._maxlen, self._retention, self._approximate)
+            if self._trim_on_add
+            else {}
+        )
+        moved = await self._promote_script(
+            keys=[self._retry_key, self._stream],
+            args=[int(time.time() * 1000), self._batch_size, *xadd_trim_tokens(trim)],
+        )
+        return int(moved)
+
+    async def run(self) -> None:
+        """Promote due retries until cancelled."""
+        moved = 0
+        while True:
+            if moved < self._batch_size:
+                await asyncio.sleep(self._poll_interval)
+            try:
+                moved = await self.promote()
+            except Exception as exc:
+                logger.error(f"Retry promotion failed: {exc}")
+                moved = 0
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from .acks import AckBuffer
+from .consumers import ConsumerRegistry
+from .reclaimer import Entry, PendingReclaimer
+from .retry import RetryScheduler
+
+
+@dataclass(eq=False)
+class Lane:
+    """One priority lane: its stream, per-stream helpers and read buffer.
+
+    ``buffer`` holds entries already read with ``XREADGROUP`` but not yet
+    handed to a handler.
+    """
+
+    name: str
+    stream: str
+    weight: int
+    acks: AckBuffer
+    retries: RetryScheduler
+    reclaimer: PendingReclaimer
+    registry: ConsumerRegistry
+    buffer: deque[Entry] = field(default_factory=deque)
+    credit: int = 0
+    waiting_since: float = field(default_factory=time.monotonic)
+
+
+class LaneScheduler:
+    """Choose the lane whose buffered entry runs next.
+
+    ``weighted`` interleaves lanes in proportion to their weights (smooth
+    weighted round robin); ``strict`` always prefers the highest-priority
+    lane with work. Either way a lane that has had entries waiting for
+    ``max_wait`` seconds without being served goes next, so low-priority
+    lanes keep moving while higher ones are saturated.
+    """
+
+    def __init__(
+        self, lanes: list[Lane], strategy: str = "weighted", max_wait: float = 1.0
+    ) -> None:
+        if strategy not in ("weighted", "strict"):
+            raise ValueError(f"Unknown priority scheduler: {strategy}")
+        self._lanes = lanes
+        self._strategy = strategy
+        self._max_wait = max_wait
+
+    def pick(self) -> Lane | None:
+        """Return the lane to take the next entry from, or ``None``."""
+        now = time.monotonic()
+        ready = []
+        for lane in self._lanes:
+            if lane.buffer:
+                ready.append(lane)
+            else:
+                lane.waiting_since = now
+        if not ready:
+            return None
+
+        starved = [lane for lane in ready if now - lane.waiting_since >= self._max_wait]
+        if starved:
+            chosen = min(starved, key=lambda lane: lane.waiting_since)
+        elif self._strategy == "strict":
+            chosen = ready[0]
+        else:
+            chosen = self._weighted(ready)
+        chosen.waiting_since = now
+        return chosen
+
+    @staticmethod
+    def _weighted(ready: list[Lane]) -> Lane:
+        total = 0
+        chosen = ready[0]
+        for lane in ready:
+            lane.credit += lane.weight
+            total += lane.weight
+            if lane.credit > chosen.credit:
+                chosen = lane
+        chosen.credit -= total
+        return chosen
@@ -1,83 +1,538 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import time
-from typing import Awaitable, Callable
+from typing import Any, Awaitable, Collection
 
 from loguru import logger
+from opentelemetry.context import Context
 from redis.asyncio import Redis
 
+from core import metrics, stages
 from core.config import AppConfig
-from core.metrics import statsd_client
-from core.tracing import tracer
-from tasks.models import TaskMessage
+from core.tracing import extract_context, tracer
+from tasks.lanes import lane_streams
+from tasks.models import TaskMessage, TaskStatus
+from tasks.serialization import decode_entry
+from tasks.status import TaskStatusStore, status_update
+from .acks import AckBuffer
+from .completion import CompletionLog
+from .consumers import ConsumerRegistry, resolve_consumer_name
+from .handlers import AsyncHandler, HandlerRegistry, TaskHandler
+from .reclaimer import PendingReclaimer
+from .retry import RetryPolicy, RetryScheduler
+from .scheduler import Lane, LaneScheduler
 
 
-AsyncHandler = Callable[[TaskMessage], Awaitable[None]]
+async def _handle_message(
+    acks: AckBuffer,
+    retries: RetryScheduler,
+    handlers: HandlerRegistry,
+    message_id: bytes,
+    data: dict[bytes, bytes],
+    timeout: float,
+    completed: CompletionLog | None = None,
+    redelivered: bool = False,
+    reclaimer: PendingReclaimer | None = None,
+    buffered: bool = False,
+) -> None:
+    """Decode a single stream entry, run its handler and acknowledge it.
+
+    The handler is chosen by task type (see :class:`HandlerRegistry`);
+    entries without a handler are dead-lettered. The handler is cancelled
+    after the ``timeout`` given in the payload metadata, the timeout
+    registered for its type, or ``timeout`` seconds, whichever applies;
+    ``timeout`` also caps the other two. Failures and timeouts are
+    handed to :class:`RetryScheduler`, with the type's retry policy, instead
+    of being retried inline. If that hand-off fails the entry is left
+    unacknowledged so it is reclaimed later.
+
+    With a :class:`CompletionLog` successful tasks are recorded as done, and
+    a ``redelivered`` entry whose task is already done is acknowledged
+    without running its handler. If ``acks`` tracks status the outcome of
+    each attempt is recorded with the acknowledgement. An entry that had
+    to wait in a lane buffer (``buffered``) or for its type's concurrency
+    slot has its idle time reset through ``reclaimer`` before it runs, so it
+    is not reclaimed as abandoned.
+    """
+
+    if buffered and reclaimer is not None:
+        await reclaimer.touch(message_id)
+    start = time.perf_counter_ns()
+    try:
+        task = decode_entry(data)
+        stages.record("consumer.decode", start)
+    except Exception as exc:
+        logger.error(f"Invalid task data: {exc}")
+        await _fail(
+            acks, retries.dead_letter(message_id, data, str(exc), 1), message_id
+        )
+        return
+
+    if redelivered and completed is not None:
+        try:
+            done = await completed.done(task.task_id)
+        except Exception as exc:
+            logger.error(f"Completion check failed: {exc}")
+            done = False
+        if done:
+            logger.info(f"Skipping completed task {task.task_id}")
+            if metrics.statsd_client is not None:
+                metrics.statsd_client.incr("task_completed_skips")
+            await acks.add(message_id)
+            return
+
+    spec = handlers.resolve(task)
+    if spec is None:
+        error = f"no handler for task type {handlers.task_type(task)!r}"
+        logger.error(error)
+        attempts = int(data.get(b"attempts", 0)) + 1
+        await _fail(
+            acks,
+            retries.dead_letter(message_id, data, error, attempts),
+            message_id,
+            _status(acks, task, "failed", attempts, error=error),
+        )
+        return
+
+    async with handlers.slot(task) as waited:
+        if waited and reclaimer is not None:
+            await reclaimer.touch(message_id)
+        await _run_handler(
+            acks,
+            retries,
+            handlers,
+            spec,
+            task,
+            message_id,
+            data,
+            timeout,
+            completed,
+        )
+
+
+async def _run_handler(
+    acks: AckBuffer,
+    retries: RetryScheduler,
+    handlers: HandlerRegistry,
+    spec: TaskHandler,
+    task: TaskMessage,
+    message_id: bytes,
+    data: dict[bytes, bytes],
+    timeout: float,
+    completed: CompletionLog | None = None,
+) -> None:
+    attempts = int(data.get(b"attempts", 0)) + 1
+    deadline = asyncio.timeout(_task_timeout(task, spec.timeout, timeout))
+    try:
+        start = time.perf_counter_ns()
+        async with deadline:
+            with tracer.start_as_current_span(
+                "task_processing_span", context=_parent_context(task)
+            ):
+                result = await handlers.call(spec, task)
+        stages.record("consumer.handler", start)
+        if metrics.statsd_client is not None:
+            elapsed = (time.perf_counter_ns() - start) // 1_000_000
+            metrics.statsd_client.timing("task_processing_time", elapsed)
+    except Exception as exc:
+        if deadline.expired():
+            error = "timed out"
+            counter = "task_timeouts"
+        else:
+            error = str(exc)
+            counter = "task_errors"
+        logger.error(f"Task processing failed: {error}")
+        if metrics.statsd_client is not None:
+            metrics.statsd_client.incr(counter)
+        policy = spec.retry or retries.policy
+        status = "retrying" if attempts < policy.max_attempts else "failed"
+        await _fail(
+            acks,
+            retries.fail(message_id, data, error, spec.retry),
+            message_id,
+            _status(acks, task, status, attempts, error=error),
+        )
+        return
+    if completed is not None:
+        try:
+            await completed.mark(task.task_id)
+        except Exception as exc:
+            logger.error(f"Failed to record completion of {task.task_id}: {exc}")
+    await acks.add(
+        message_id, _status(acks, task, "succeeded", attempts, result=result)
+    )
+
+
+def _parent_context(task: TaskMessage) -> Context | None:
+    """Return the enqueuing span's context so processing joins its trace."""
+
+    trace_context = task.trace_context
+    if not trace_context.traceparent:
+        return None
+    carrier = {"traceparent": trace_context.traceparent}
+    if trace_context.tracestate:
+        carrier["tracestate"] = trace_context.tracestate
+    return extract_context(carrier)
+
+
+def _task_timeout(
+    task: TaskMessage, handler_timeout: float | None, limit: float
+) -> float:
+    """Return the task's timeout, never more than ``limit``.
+
+    The ``timeout`` from the payload metadata wins over the handler's
+    registered timeout, which wins over ``limit`` itself. Both are client or
+    handler supplied, so they are clamped.
+    """
+
+    override = task.payload.metadata.get("timeout")
+    if isinstance(override, (int, float)) and not isinstance(override, bool):
+        if override > 0:
+            return min(float(override), limit)
+    if handler_timeout:
+        return min(handler_timeout, limit)
+    return limit
+
+
+def _status(
+    acks: AckBuffer,
+    task: TaskMessage,
+    status: str,
+    attempts: int,
+    result: Any = None,
+    error: str | None = None,
+) -> TaskStatus | None:
+    """Return the attempt's status if ``acks`` records statuses."""
+
+    if not acks.tracks_status:
+        return None
+    return status_update(task.task_id, status, attempts, result=result, error=error)
+
+
+async def _fail(
+    acks: AckBuffer,
+    handoff: Awaitable[None],
+    message_id: bytes,
+    status: TaskStatus | None = None,
+) -> None:
+    """Acknowledge ``message_id`` once ``handoff`` has stored it elsewhere."""
+
+    try:
+        await handoff
+    except Exception as exc:
+        logger.error(f"Failed to reschedule task {message_id!r}: {exc}")
+        return
+    await acks.add(message_id, status)
+
+
+async def _drain(in_flight: set[asyncio.Task[None]]) -> None:
+    """Wait for handlers of entries that were already read.
+
+    A cancellation arriving during the drain is deferred until those handlers
+    finish, otherwise their entries would linger unacknowledged.
+    """
+
+    if not in_flight:
+        return
+    try:
+        await asyncio.wait(set(in_flight))
+    except asyncio.CancelledError:
+        await asyncio.wait(set(in_flight))
+        raise
+
+
+def _build_lanes(config: AppConfig, redis: Redis, consumer: str) -> list[Lane]:
+    """Create a :class:`Lane` per priority lane, or one for the main stream."""
+
+    streams = lane_streams(config) or {"default": config.redis_stream_name}
+    weights = config.priority_weights or list(range(len(streams), 0, -1))
+    if len(weights) != len(streams):
+        raise ValueError("priority_weights must give one weight per lane")
+    group = config.redis_consumer_group
+    statuses = (
+        TaskStatusStore(redis, config.redis_stream_name, config.task_status_ttl)
+        if config.task_status_ttl > 0
+        else None
+    )
+    policy = RetryPolicy(
+        max_attempts=config.retry_max_attempts,
+        backoff_base=config.retry_backoff_base,
+        backoff_factor=config.retry_backoff_factor,
+        backoff_max=config.retry_backoff_max,
+    )
+    lanes = []
+    for (name, stream), weight in zip(streams.items(), weights):
+        suffix = "" if stream == config.redis_stream_name else f":{name}"
+        lanes.append(
+            Lane(
+                name=name,
+                stream=stream,
+                weight=max(1, weight),
+                acks=AckBuffer(
+                    redis,
+                    stream,
+                    group,
+                    max_size=config.ack_batch_size,
+                    flush_interval=config.ack_flush_interval,
+                    statuses=statuses,
+                ),
+                retries=RetryScheduler(
+                    redis,
+                    stream,
+                    config.redis_retry_key + suffix,
+                    config.redis_dead_letter_stream,
+                    policy=policy,
+                    poll_interval=config.retry_poll_interval,
+                    maxlen=config.stream_maxlen,
+                    retention=config.stream_retention_seconds,
+                    approximate=config.stream_trim_approximate,
+                    trim_on_add=config.stream_trim_interval <= 0,
+                ),
+                reclaimer=PendingReclaimer(
+                    redis,
+                    stream,
+                    group,
+                    consumer,
+                    interval=config.reclaim_interval,
+                    min_idle_ms=config.reclaim_min_idle_ms,
+                    batch_size=config.reclaim_batch_size,
+                ),
+                registry=ConsumerRegistry(
+                    redis,
+                    stream,
+                    group,
+                    consumer,
+                    heartbeat_interval=config.consumer_heartbeat_interval,
+                    ttl=config.consumer_ttl,
+                ),
+            )
+        )
+    return lanes
+
+
+def _reading(empty: list[Lane], free: int, reads: int) -> list[Lane]:
+    """Return the lanes to refill with the next ``XREADGROUP``.
+
+    ``COUNT`` applies to each stream, so no more lanes are read than there
+    are ``free`` slots and the buffers never hold more entries than can be
+    dispatched. When that leaves lanes out, which ones are read rotates
+    with ``reads`` so every lane gets its turn.
+    """
+    if len(empty) <= free:
+        return empty
+    start = reads % len(empty)
+    return (empty[start:] + empty[:start])[:free]
+
+
+def _queue_latency_ms(message_id: bytes) -> int:
+    """Return milliseconds since the entry was added, from its stream ID."""
+
+    return max(0, int(time.time() * 1000) - int(message_id.split(b"-", 1)[0]))
 
 
 async def process_tasks(
-    config: AppConfig, handler: AsyncHandler, shutdown_event: asyncio.Event
+    config: AppConfig,
+    handler: AsyncHandler | HandlerRegistry,
+    shutdown_event: asyncio.Event,
+    redis: Redis,
 ) -> None:
-    """Continuously read and process tasks from Redis Streams."""
+    """Continuously read and process tasks from Redis Streams.
+
+    Entries are read in batches of up to ``redis_read_count`` and handled
+    concurrently, with at most ``max_concurrent_tasks`` handlers in flight.
+    Only as many entries as there are free slots are requested, so a slow
+    handler applies backpressure instead of growing an unbounded backlog.
+    Each entry is acknowledged after its own handler completes; the
+    acknowledgements are batched by :class:`AckBuffer`. Entries abandoned by
+    other consumers are periodically claimed by :class:`PendingReclaimer`
+    and handled the same way. On shutdown no new
+    entries are read, in-flight handlers are awaited, the buffer is flushed
+    and the consumer leaves the group (see :class:`ConsumerRegistry`).
+
+    With ``priority_lanes`` configured each lane has its own stream. Lanes
+    with an empty read buffer are refilled by one ``XREADGROUP`` over their
+    streams, splitting the free slots between them so all buffers together
+    never hold more entries than there are free slots, and
+    :class:`LaneScheduler` decides which buffered entry gets the next free
+    slot. Entries still buffered at shutdown are handled before the
+    consumer stops.
+
+    ``handler`` is a :class:`HandlerRegistry`, or a single handler used for
+    every task. Tasks waiting for a per-type concurrency slot do not count
+    against ``max_concurrent_tasks``, but reading pauses once as many tasks
+    are waiting, or while a type has as many tasks waiting as it may run.
+
+    With a positive ``completion_ttl`` completed task IDs are remembered for
+    that many seconds so reclaimed entries of finished tasks are acknowledged
+    instead of run twice (see :class:`CompletionLog`). With a positive
+    ``task_status_ttl`` each attempt's status and the handler's result are
+    kept for that many seconds (see :class:`TaskStatusStore`), written in
+    the acknowledgement flushes.
+
+    Handlers are cancelled after ``task_timeout`` seconds. Per-type and
+    per-task timeouts may shorten that but never extend it, and no timeout
+    exceeds ``reclaim_min_idle_ms``.
+
+    ``redis`` is the application-scoped client; its pool is owned by the
+    caller and is not closed here.
+    """
 
-    stream = config.redis_stream_name
     group = config.redis_consumer_group
-    consumer = config.redis_consumer_name
+    consumer = resolve_consumer_name(config)
+    limit = max(1, config.max_concurrent_tasks)
+    # A handler running longer than reclaim_min_idle_ms would be reclaimed
+    # and run again by another consumer while still running here.
+    timeout = min(config.task_timeout, config.reclaim_min_idle_ms / 1000)
+    in_flight: set[asyncio.Task[None]] = set()
+    handlers = (
+        handler
+        if isinstance(handler, HandlerRegistry)
+        else HandlerRegistry(fallback=handler)
+    )
+
+    def _free() -> int:
+        if handlers.saturated:
+            return 0
+        running = len(in_flight) - handlers.waiting
+        return limit - max(running, handlers.waiting)
+
+    completed = (
+        CompletionLog(redis, config.redis_stream_name, config.completion_ttl)
+        if config.completion_ttl > 0
+        else None
+    )
 
-    redis = Redis.from_url(config.redis_url)
-    async with redis:
+    lanes = _build_lanes(config, redis, consumer)
+    by_stream = {lane.stream.encode(): lane for lane in lanes}
+    scheduler = LaneScheduler(
+        lanes, config.priority_scheduler, max_wait=config.priority_max_wait
+    )
+
+    for lane in lanes:
         try:
-            await redis.xgroup_create(stream, group, mkstream=True)
+            await redis.xgroup_create(lane.stream, group, mkstream=True)
         except Exception:
             # Group might already exist
             pass
+        try:
+            await lane.registry.register()
+        except Exception as exc:
+            logger.error(f"Consumer registration failed: {exc}")
 
-        logger.info(f"Connected to Redis stream {stream}")
+    streams = ", ".join(lane.stream for lane in lanes)
+    logger.info(f"Connected to Redis streams {streams}")
 
-        while not shutdown_event.is_set():
-            try:
-                records = await redis.xreadgroup(
-                    group,
-                    consumer,
-                    streams={stream: ">"},
-                    count=1,
-                    block=1000,
+    def _spawn(
+        lane: Lane,
+        message_id: bytes,
+        data: dict[bytes, bytes],
+        redelivered: bool = False,
+        buffered: bool = False,
+    ) -> None:
+        task = asyncio.create_task(
+            _handle_message(
+                lane.acks,
+                lane.retries,
+                handlers,
+                message_id,
+                data,
+                timeout,
+                completed,
+                redelivered,
+                lane.reclaimer,
+                buffered,
+            )
+        )
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    def _dispatch(fresh: Collection[Lane] = ()) -> None:
+        # Entries of lanes not refilled by the read just made have waited
+        # in the buffer since an earlier iteration.
+        while _free() > 0:
+            lane = scheduler.pick()
+            if lane is None:
+                return
+            message_id, data = lane.buffer.popleft()
+            if metrics.statsd_client is not None:
+                metrics.statsd_client.timing(
+                    f"task_queue_latency.{lane.name}", _queue_latency_ms(message_id)
                 )
-                if not records:
+            _spawn(lane, message_id, data, buffered=lane not in fresh)
+
+    background = [
+        asyncio.create_task(job)
+        for lane in lanes
+        for job in (lane.acks.run(), lane.registry.run(), lane.retries.run())
+    ]
+    reads = 0
+    try:
+        while not shutdown_event.is_set() or any(lane.buffer for lane in lanes):
+            try:
+                if _free() <= 0:
+                    await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                if shutdown_event.is_set():
+                    _dispatch()
+                    continue
+
+                for lane in lanes:
+                    if not lane.reclaimer.due():
+                        continue
+                    reclaimed = await lane.reclaimer.reclaim(_free())
+                    for message_id, data, deliveries in reclaimed:
+                        if deliveries > config.reclaim_max_deliveries:
+                            await _fail(
+                                lane.acks,
+                                lane.retries.dead_letter(
+                                    message_id,
+                                    data,
+                                    "max deliveries exceeded",
+                                    deliveries,
+                                ),
+                                message_id,
+                            )
+                        else:
+                            _spawn(lane, message_id, data, redelivered=True)
+                if _free() <= 0:
                     continue
 
-                for _, messages in records:
-                    for message_id, data in messages:
-                        raw = data.get(b"task", b"{}").decode()
-                        try:
-                            task = TaskMessage.model_validate_json(raw)
-                        except Exception as exc:
-                            logger.error(f"Invalid task data: {exc}")
-                            await redis.xack(stream, group, message_id)
-                            await redis.xdel(stream, message_id)
-                            continue
-
-                        for attempt, delay in enumerate((0.1, 0.2, 0.4), start=1):
-                            try:
-                                start = time.perf_counter()
-                                with tracer.start_as_current_span("task_processing_span"):
-                                    await handler(task)
-                                if statsd_client is not None:
-                                    elapsed = int((time.perf_counter() - start) * 1000)
-                                    statsd_client.timing("task_processing_time", elapsed)
-                                await redis.xack(stream, group, message_id)
-                                await redis.xdel(stream, message_id)
-                                break
-                            except Exception as exc:
-                                logger.error(f"Task processing failed: {exc}")
-                                if attempt == 3:
-                                    await redis.xack(stream, group, message_id)
-                                    await redis.xdel(stream, message_id)
-                                else:
-                                    await asyncio.sleep(delay)
+                empty = [lane for lane in lanes if not lane.buffer]
+                reading = _reading(empty, _free(), reads)
+                if reading:
+                    reads += 1
+                    start = time.perf_counter_ns()
+                    records = await redis.xreadgroup(
+                        group,
+                        consumer,
+                        streams={lane.stream: ">" for lane in reading},
+                        count=min(config.redis_read_count, _free() // len(reading)),
+                        block=(
+                            config.redis_read_block_ms
+                            if len(empty) == len(lanes)
+                            else None
+                        ),
+                    )
+                    stages.record("consumer.read", start)
+                    for stream, messages in records or ():
+                        key = stream if isinstance(stream, bytes) else stream.encode()
+                        by_stream[key].buffer.extend(messages)
+                _dispatch(reading)
             except asyncio.CancelledError:
                 break
             except Exception as exc:  # pragma: no cover - defensive
                 logger.error(f"Processor error: {exc}")
                 await asyncio.sleep(1)
+    finally:
+        try:
+            await _drain(in_flight)
+        finally:
+            for job in background:
+                job.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await job
+            for lane in lanes:
+                await lane.acks.flush()
+                await lane.registry.deregister()
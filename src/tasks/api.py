@@ -1,37 +1,211 @@
 from __future__ import annotations
 
-from pydantic import ValidationError
-from redis.asyncio import Redis
+import time
+
+import msgspec
+from opentelemetry import trace
 from starlette.requests import Request
 from starlette.responses import Response
 
+from core import stages
 from core.config import AppConfig
-from core.metrics import statsd_client
-from .models import TaskPayload
-from .repository import TaskRepository
-from .service import TaskService
+from core.tracing import inject_context
+from .models import TaskPayload, TaskStatus, TraceContext
+from .serialization import decode_payload, split_batch
+from .service import IDEMPOTENCY_METADATA_KEY, TaskService
+from .status import TaskStatusStore
+
+_NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+_MAX_IDEMPOTENCY_KEY_LENGTH = 255
 
 
 async def create_task(request: Request, config: AppConfig) -> Response:
-    """Validate request and enqueue task."""
-    body = await request.body()
-    if len(body) > config.max_payload_size:
+    """Validate request and enqueue task.
+
+    Responds 202 with ``{"task_id"}``; the ID can be passed to
+    :func:`get_task`. With an ``Idempotency-Key`` header (or
+    ``idempotency_key`` metadata) a repeated key returns the original task
+    ID with ``Idempotent-Replayed: true`` instead of enqueuing again. Keys
+    longer than 255 characters are rejected with 400.
+    """
+    key = request.headers.get("idempotency-key") or None
+    if _key_too_long(key):
+        return Response(status_code=400)
+
+    start = time.perf_counter_ns()
+    body = await _read_body(request, config.max_payload_size)
+    stages.record("api.read_body", start)
+    if body is None:
+        return Response(status_code=413)
+
+    start = time.perf_counter_ns()
+    try:
+        payload = decode_payload(body)
+    except msgspec.DecodeError:
+        return Response(status_code=400)
+    if _key_too_long(payload.metadata.get(IDEMPOTENCY_METADATA_KEY)):
+        return Response(status_code=400)
+    stages.record("api.validate", start)
+
+    start = time.perf_counter_ns()
+    service: TaskService = request.app.state.task_service
+    result = await service.enqueue(
+        payload,
+        trace_context=_trace_context(request),
+        raw_payload=body,
+        idempotency_key=key,
+    )
+    stages.record("api.enqueue", start)
+
+    return Response(
+        msgspec.json.encode({"task_id": result.task_id}),
+        status_code=202,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"} if result.duplicate else None,
+    )
+
+
+async def create_tasks_batch(request: Request, config: AppConfig) -> Response:
+    """Validate a batch of payloads and enqueue the valid ones together.
+
+    Accepts a JSON array or NDJSON (``application/x-ndjson``). Responds 202
+    with one result per item in input order: ``{"index", "task_id"}`` for
+    enqueued items and ``{"index", "error"}`` for rejected ones. Items whose
+    ``idempotency_key`` metadata was already used also carry
+    ``"duplicate": true`` and the original task ID.
+    """
+    body = await _read_body(request, config.batch_max_bytes)
+    if body is None:
         return Response(status_code=413)
 
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
     try:
-        payload = TaskPayload.model_validate_json(body)
-    except ValidationError:
+        items = split_batch(body, ndjson=content_type in _NDJSON_TYPES)
+    except msgspec.DecodeError:
         return Response(status_code=400)
+    if len(items) > config.batch_max_items:
+        return Response(status_code=413)
+
+    results: list[dict[str, object]] = []
+    payloads: list[TaskPayload] = []
+    raws: list[bytes | None] = []
+    accepted: list[dict[str, object]] = []
+    for index, raw in enumerate(items):
+        result: dict[str, object] = {"index": index}
+        results.append(result)
+        if len(raw) > config.max_payload_size:
+            result["error"] = "payload too large"
+            continue
+        try:
+            payload = decode_payload(raw)
+        except msgspec.DecodeError as exc:
+            result["error"] = str(exc)
+            continue
+        if _key_too_long(payload.metadata.get(IDEMPOTENCY_METADATA_KEY)):
+            result["error"] = "idempotency key too long"
+            continue
+        payloads.append(payload)
+        raws.append(raw)
+        accepted.append(result)
+
+    if payloads:
+        service: TaskService = request.app.state.task_service
+        enqueued = await service.enqueue_many(
+            payloads, trace_context=_trace_context(request), raw_payloads=raws
+        )
+        for result, outcome in zip(accepted, enqueued):
+            result["task_id"] = outcome.task_id
+            if outcome.duplicate:
+                result["duplicate"] = True
+
+    return Response(
+        msgspec.json.encode({"results": results}),
+        status_code=202,
+        media_type="application/json",
+    )
+
+
+async def get_task(request: Request, config: AppConfig) -> Response:
+    """Return the recorded status and result of a task.
+
+    Responds 200 once an attempt has finished. A task without a recorded
+    status yet (queued, running, or not known at all) gets 202 with status
+    ``unknown``. With ``?wait=<seconds>`` (capped at
+    ``task_status_max_wait``) the request is held until the task finishes
+    or its status changes, instead of the client polling in a loop.
+    Responds 404 when status tracking is disabled (``task_status_ttl``).
+    """
+    if config.task_status_ttl <= 0:
+        return Response(status_code=404)
+    task_id = request.path_params["task_id"]
+    try:
+        wait = float(request.query_params.get("wait", 0))
+    except ValueError:
+        return Response(status_code=400)
+
+    store: TaskStatusStore = request.app.state.task_status
+    if wait > 0:
+        status = await store.wait(task_id, min(wait, config.task_status_max_wait))
+    else:
+        status = await store.get(task_id)
+    if status is None:
+        unknown = TaskStatus(task_id=task_id, status="unknown", attempts=0)
+        return Response(
+            msgspec.json.encode(unknown),
+            status_code=202,
+            media_type="application/json",
+        )
+    return Response(
+        msgspec.json.encode(status), status_code=200, media_type="application/json"
+    )
+
+
+async def _read_body(request: Request, limit: int) -> bytes | None:
+    """Read the request body, or return ``None`` once it exceeds ``limit``.
+
+    A declared ``Content-Length`` over the limit is rejected before anything
+    is read. Otherwise the body is streamed with a running total, so an
+    oversized upload is abandoned at the first chunk past the limit. A body
+    received in one chunk is returned as is, without copying.
+    """
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        return None
+
+    chunks: list[bytes] = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            return None
+        if chunk:
+            chunks.append(chunk)
+    if len(chunks) == 1:
+        return chunks[0]
+    return b"".join(chunks)
+
+
+def _trace_context(request: Request) -> TraceContext:
+    """Capture the current span for propagation through the stream.
 
-    trace_id = request.headers.get("trace_id", "")
-    span_id = request.headers.get("span_id", "")
+    Falls back to the legacy ``trace_id``/``span_id`` headers when no span
+    is active.
+    """
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return TraceContext(
+            trace_id=request.headers.get("trace_id", ""),
+            span_id=request.headers.get("span_id", ""),
+        )
+    carrier = inject_context()
+    return TraceContext(
+        trace_id=format(span_context.trace_id, "032x"),
+        span_id=format(span_context.span_id, "016x"),
+        traceparent=carrier.get("traceparent", ""),
+        tracestate=carrier.get("tracestate", ""),
+    )
 
-    async with Redis.from_url(config.redis_url) as redis:
-        repo = TaskRepository(redis, config.redis_stream_name)
-        service = TaskService(repo)
-        await service.enqueue(payload, trace_id=trace_id, span_id=span_id)
-        if statsd_client is not None:
-            size = await redis.xlen(config.redis_stream_name)
-            statsd_client.gauge("task_queue_size", size)
 
-    return Response(status_code=202)
+def _key_too_long(key: object) -> bool:
+    """Whether ``key``, from the header or metadata, is over the limit."""
+    return isinstance(key, str) and len(key) > _MAX_IDEMPOTENCY_KEY_LENGTH
@@ -0,0 +1,40 @@
+"""Priority lanes: one Redis stream per task priority.
+
+Lanes are listed in ``priority_lanes`` from highest to lowest priority. The
+default lane keeps ``redis_stream_name`` so existing producers and entries
+stay on the same stream; every other lane ``x`` uses
+``{redis_stream_name}:x``. Producers pick a lane with the ``priority``
+metadata key.
+"""
+
+from __future__ import annotations
+
+from core.config import AppConfig
+
+
+def default_lane(config: AppConfig) -> str:
+    """Return the lane for tasks without a known ``priority``.
+
+    Defaults to the lowest-priority lane.
+    """
+    if config.priority_default_lane:
+        return config.priority_default_lane
+    return config.priority_lanes[-1] if config.priority_lanes else ""
+
+
+def lane_streams(config: AppConfig) -> dict[str, str]:
+    """Map each configured lane to its stream, highest priority first.
+
+    Empty when no lanes are configured.
+    """
+    default = default_lane(config)
+    if config.priority_lanes and default not in config.priority_lanes:
+        raise ValueError(f"Unknown default priority lane: {default}")
+    return {
+        lane: (
+            config.redis_stream_name
+            if lane == default
+            else f"{config.redis_stream_name}:{lane}"
+        )
+        for lane in config.priority_lanes
+    }
@@ -1,27 +1,51 @@
 from __future__ import annotations
 
 from typing import Any, Dict
-from pydantic import BaseModel, Field
 
+import msgspec
 
-class TaskPayload(BaseModel):
+
+class TaskPayload(msgspec.Struct):
     """Payload data for a task."""
 
     data: Any
-    metadata: Dict[str, Any] = Field(default_factory=dict)
+    metadata: Dict[str, Any] = msgspec.field(default_factory=dict)
+
 
+class TraceContext(msgspec.Struct):
+    """Tracing information for a task.
 
-class TraceContext(BaseModel):
-    """Tracing information for a task."""
+    ``traceparent`` and ``tracestate`` carry the W3C trace context of the
+    span that enqueued the task.
+    """
 
     trace_id: str
     span_id: str
+    traceparent: str = ""
+    tracestate: str = ""
 
 
-class TaskMessage(BaseModel):
+class TaskMessage(msgspec.Struct):
     """Message structure stored in Redis Streams."""
 
     task_id: str
     timestamp: str
     payload: TaskPayload
     trace_context: TraceContext
+
+
+class TaskStatus(msgspec.Struct):
+    """Latest recorded state of a task.
+
+    ``status`` is ``succeeded``, ``retrying`` or ``failed``, or ``unknown``
+    (with no ``attempts``) before any attempt has finished. ``result`` is
+    the handler's return value as JSON; ``error`` the last failure. Every
+    field is always encoded, ``null`` where it does not apply.
+    """
+
+    task_id: str
+    status: str
+    updated_at: str = ""
+    attempts: int = 1
+    result: msgspec.Raw | None = None
+    error: str | None = None
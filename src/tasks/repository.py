@@ -1,21 +1,333 @@
 from __future__ import annotations
 
+import asyncio
+import time
+from typing import Any, Mapping
+
+from loguru import logger
 from redis.asyncio import Redis
 
+from core import metrics, stages
 from .models import TaskMessage
+from .serialization import Codec, MsgspecJsonCodec
+
+# Add a message only if its idempotency key is unused. The key stores the ID
+# of the task that claimed it, which is returned to every later caller.
+_ADD_UNIQUE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner then
+    return owner
+end
+redis.call('XADD', KEYS[2], unpack(ARGV, 3))
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[1])
+return ARGV[2]
+"""
+
+_Fields = dict[str, bytes | str]
+# Stream, fields, caller's future and perf_counter_ns when it was queued.
+_Pending = tuple[str, _Fields, "asyncio.Future[str]", int]
 
 
 class TaskRepository:
-    """Repository for storing tasks in Redis Streams."""
+    """Repository for storing tasks in Redis Streams.
+
+    With a positive ``batch_window`` concurrent :meth:`add` calls are
+    coalesced: messages are collected for up to ``batch_window`` seconds or
+    ``batch_size`` messages and written with one pipelined round trip of
+    ``XADD`` commands. Each caller still receives its own stream ID.
+
+    Messages are encoded with ``codec``; see :mod:`tasks.serialization`.
 
-    def __init__(self, redis: Redis, stream_name: str) -> None:
+    The stream is capped at ``maxlen`` entries, or, with a positive
+    ``retention``, to entries younger than ``retention`` seconds (``MINID``).
+    Trimming is approximate (``~``) unless ``approximate`` is false, letting
+    Redis drop whole macro nodes. With ``trim_on_add`` false ``XADD`` does
+    not trim at all and :meth:`trim` is expected to run periodically.
+
+    ``lanes`` maps priority lane names to streams. A message whose
+    ``priority`` metadata names a lane is written to that lane's stream;
+    all other messages go to ``stream_name``.
+
+    :meth:`add_unique` deduplicates by an idempotency key stored next to the
+    stream as ``{stream_name}:idempotency:{key}``.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream_name: str,
+        batch_size: int = 1,
+        batch_window: float = 0.0,
+        codec: Codec | None = None,
+        maxlen: int = 100000,
+        retention: float = 0.0,
+        approximate: bool = True,
+        trim_on_add: bool = True,
+        lanes: Mapping[str, str] | None = None,
+    ) -> None:
         self._redis = redis
         self._stream = stream_name
+        self._codec = codec or MsgspecJsonCodec()
+        self._batch_size = max(1, batch_size)
+        self._batch_window = batch_window
+        self._lanes = dict(lanes or {})
+        self._add_unique_script: Any = None
+        self._pending: list[_Pending] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task[None]] = set()
+        self._maxlen = maxlen
+        self._retention = retention
+        self._approximate = approximate
+        self._trim_on_add = trim_on_add
+
+    async def add(self, message: TaskMessage, raw_payload: bytes | None = None) -> str:
+        """Add message to Redis stream and return its stream ID.
+
+        ``raw_payload`` is the payload as received, used verbatim by codecs
+        that can pass it through.
+        """
+        start = time.perf_counter_ns()
+        stream = self._stream_for(message)
+        fields = self._fields(message, raw_payload)
+        stages.record("enqueue.encode", start)
+        if self._batch_window <= 0 or self._batch_size == 1:
+            start = time.perf_counter_ns()
+            message_id = await self._redis.xadd(stream, fields, **self._add_trim_args())
+            stages.record("redis.xadd", start)
+            return _decode(message_id)
 
-    async def add(self, message: TaskMessage) -> None:
-        """Add message to Redis stream."""
-        await self._redis.xadd(
-            self._stream,
-            {"task": message.model_dump_json()},
-            maxlen=100000,
+        future: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+        self._pending.append((stream, fields, future, time.perf_counter_ns()))
+        if len(self._pending) >= self._batch_size:
+            self._schedule_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self._batch_window, self._schedule_flush
+            )
+        return await future
+
+    async def add_unique(
+        self,
+        message: TaskMessage,
+        key: str,
+        ttl: int,
+        raw_payload: bytes | None = None,
+    ) -> str:
+        """Add message unless ``key`` was used in the last ``ttl`` seconds.
+
+        The key check, ``XADD`` and key write run atomically in one script.
+        Returns the ID of the task owning ``key``: ``message.task_id`` if the
+        message was added, otherwise the task that used the key first.
+        """
+        start = time.perf_counter_ns()
+        owner = await self._unique_script()(
+            keys=[self._idempotency_key(key), self._stream_for(message)],
+            args=self._unique_args(message, ttl, raw_payload),
         )
+        stages.record("redis.add_unique", start)
+        return _decode(owner)
+
+    async def add_many(
+        self,
+        messages: list[TaskMessage],
+        raw_payloads: list[bytes | None] | None = None,
+        keys: list[str | None] | None = None,
+        ttl: int = 0,
+    ) -> list[str]:
+        """Add several messages with one pipelined round trip.
+
+        Messages with an idempotency key in ``keys`` are added as by
+        :meth:`add_unique` and yield the owning task ID; the others yield
+        their stream ID.
+        """
+        raws = raw_payloads or [None] * len(messages)
+        if not keys or not any(keys):
+            return await self._write(
+                [
+                    (self._stream_for(message), self._fields(message, raw))
+                    for message, raw in zip(messages, raws)
+                ]
+            )
+
+        trim_args = self._add_trim_args()
+        script = self._unique_script()
+        pipe = self._redis.pipeline(transaction=False)
+        for message, raw, key in zip(messages, raws, keys):
+            stream = self._stream_for(message)
+            if key is None:
+                pipe.xadd(stream, self._fields(message, raw), **trim_args)
+            else:
+                await script(
+                    keys=[self._idempotency_key(key), stream],
+                    args=self._unique_args(message, ttl, raw),
+                    client=pipe,
+                )
+        start = time.perf_counter_ns()
+        results = await pipe.execute()
+        stages.record("redis.xadd_pipeline", start)
+        return [_decode(result) for result in results]
+
+    async def sample_queue_size(self) -> None:
+        """Report the current stream length as the ``task_queue_size`` gauge.
+
+        With priority lanes each lane's length is also reported as
+        ``task_queue_size.<lane>`` and ``task_queue_size`` is their sum.
+        """
+        if metrics.statsd_client is None:
+            return
+        if not self._lanes:
+            size = await self._redis.xlen(self._stream)
+            metrics.statsd_client.gauge("task_queue_size", size)
+            return
+        pipe = self._redis.pipeline(transaction=False)
+        for stream in self._lanes.values():
+            pipe.xlen(stream)
+        sizes = await pipe.execute()
+        for lane, size in zip(self._lanes, sizes):
+            metrics.statsd_client.gauge(f"task_queue_size.{lane}", size)
+        metrics.statsd_client.gauge("task_queue_size", sum(sizes))
+
+    async def trim(self) -> None:
+        """Apply the retention policy with ``XTRIM``.
+
+        Processed entries are deleted when acknowledged, so whatever is
+        trimmed was never processed. The number removed is reported as the
+        ``stream_trimmed_entries`` counter; a steadily positive rate means
+        producers outrun the consumers within the configured retention.
+        """
+        removed = 0
+        for stream in self._lanes.values() or [self._stream]:
+            removed += await self._redis.xtrim(stream, **self._trim_args())
+        if removed and metrics.statsd_client is not None:
+            metrics.statsd_client.incr("stream_trimmed_entries", removed)
+
+    async def close(self) -> None:
+        """Write any buffered messages and wait for in-progress flushes."""
+        if self._pending:
+            self._schedule_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _unique_script(self) -> Any:
+        if self._add_unique_script is None:
+            self._add_unique_script = self._redis.register_script(_ADD_UNIQUE_SCRIPT)
+        return self._add_unique_script
+
+    def _idempotency_key(self, key: str) -> str:
+        return f"{self._stream}:idempotency:{key}"
+
+    def _unique_args(
+        self, message: TaskMessage, ttl: int, raw_payload: bytes | None
+    ) -> list[bytes | str | int]:
+        args: list[bytes | str | int] = [ttl, message.task_id]
+        args += xadd_trim_tokens(self._add_trim_args())
+        args.append("*")
+        for field, value in self._fields(message, raw_payload).items():
+            args += [field, value]
+        return args
+
+    def _stream_for(self, message: TaskMessage) -> str:
+        lane = message.payload.metadata.get("priority")
+        if isinstance(lane, str):
+            return self._lanes.get(lane, self._stream)
+        return self._stream
+
+    def _trim_args(self) -> dict[str, Any]:
+        return trim_args(self._maxlen, self._retention, self._approximate)
+
+    def _add_trim_args(self) -> dict[str, Any]:
+        return self._trim_args() if self._trim_on_add else {}
+
+    def _fields(self, message: TaskMessage, raw_payload: bytes | None) -> _Fields:
+        return {
+            "task": self._codec.encode(message, raw_payload),
+            "format": self._codec.name,
+        }
+
+    async def _write(self, entries: list[tuple[str, _Fields]]) -> list[str]:
+        if not entries:
+            return []
+        return [_decode(message_id) for message_id in await self._xadd_all(entries)]
+
+    async def _xadd_all(
+        self, entries: list[tuple[str, _Fields]], raise_on_error: bool = True
+    ) -> list[Any]:
+        """Pipeline an ``XADD`` per entry and return the raw replies.
+
+        With ``raise_on_error=False`` a failed command yields its exception
+        in place of a stream ID instead of failing the whole pipeline.
+        """
+        trim_args = self._add_trim_args()
+        pipe = self._redis.pipeline(transaction=False)
+        for stream, fields in entries:
+            pipe.xadd(stream, fields, **trim_args)
+        start = time.perf_counter_ns()
+        replies = await pipe.execute(raise_on_error=raise_on_error)
+        stages.record("redis.xadd_pipeline", start)
+        return replies
+
+    def _schedule_flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list[_Pending]) -> None:
+        for *_, queued in batch:
+            stages.record("enqueue.batch_wait", queued)
+        try:
+            replies = await self._xadd_all(
+                [(stream, fields) for stream, fields, *_ in batch],
+                raise_on_error=False,
+            )
+        except Exception as exc:
+            logger.error(f"Enqueue batch failed: {exc}")
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        # Each caller gets the outcome of its own XADD: the entries that
+        # were written must not be reported as failed and enqueued again.
+        failed = 0
+        for (_, _, future, _), reply in zip(batch, replies):
+            if future.done():
+                continue
+            if isinstance(reply, Exception):
+                failed += 1
+                future.set_exception(reply)
+            else:
+                future.set_result(_decode(reply))
+        if failed:
+            logger.error(f"Enqueue batch: {failed} of {len(batch)} entries failed")
+        if metrics.statsd_client is not None:
+            metrics.statsd_client.gauge("enqueue_batch_size", len(batch))
+
+
+def trim_args(maxlen: int, retention: float, approximate: bool) -> dict[str, Any]:
+    """Return the ``XADD``/``XTRIM`` keyword arguments of a retention policy.
+
+    See :class:`TaskRepository` for the meaning of the arguments.
+    """
+    if retention > 0:
+        cutoff = int((time.time() - retention) * 1000)
+        return {"minid": f"{cutoff}-0", "approximate": approximate}
+    return {"maxlen": maxlen, "approximate": approximate}
+
+
+def xadd_trim_tokens(trim: dict[str, Any]) -> list[str | int]:
+    """Spell out :func:`trim_args` as raw ``XADD`` arguments, for scripts."""
+    if not trim:
+        return []
+    threshold = "MINID" if "minid" in trim else "MAXLEN"
+    return [
+        threshold,
+        "~" if trim["approximate"] else "=",
+        trim.get("minid", trim.get("maxlen")),
+    ]
+
+
+def _decode(message_id: bytes | str) -> str:
+    return message_id.decode() if isinstance(message_id, bytes) else message_id
@@ -0,0 +1,150 @@
+"""Wire formats for task messages stored in Redis Streams.
+
+Every stream entry carries the encoded message in its ``task`` field and the
+name of the codec in its ``format`` field, so consumers decode entries
+written with any supported format. Entries without ``format`` are JSON.
+
+When the request body is available, JSON codecs splice it into the message
+verbatim instead of re-encoding the validated payload.
+"""
+
+from __future__ import annotations
+
+from typing import Protocol
+
+import msgspec
+import orjson
+
+from .models import TaskMessage, TaskPayload, TraceContext
+
+_payload_decoder = msgspec.json.Decoder(TaskPayload)
+
+
+def decode_payload(body: bytes) -> TaskPayload:
+    """Validate a JSON request body as a :class:`TaskPayload`.
+
+    Raises :class:`msgspec.DecodeError` on malformed or invalid input.
+    """
+    return _payload_decoder.decode(body)
+
+
+_raw_list_decoder = msgspec.json.Decoder(list[msgspec.Raw])
+
+
+def split_batch(body: bytes, ndjson: bool = False) -> list[bytes]:
+    """Split a batch body into the raw JSON of each item.
+
+    ``body`` is a JSON array, or newline-delimited JSON when ``ndjson`` is
+    set. Items are not validated; blank NDJSON lines are skipped. Raises
+    :class:`msgspec.DecodeError` if a JSON body is not an array.
+    """
+    if ndjson:
+        return [line for line in body.splitlines() if line.strip()]
+    return [bytes(item) for item in _raw_list_decoder.decode(body)]
+
+
+class _RawMessage(msgspec.Struct):
+    """Envelope whose payload is already encoded in the target format."""
+
+    task_id: str
+    timestamp: str
+    payload: msgspec.Raw
+    trace_context: TraceContext
+
+
+class Codec(Protocol):
+    """Encoder/decoder pair for one wire format."""
+
+    name: str
+
+    def encode(self, message: TaskMessage, raw_payload: bytes | None = None) -> bytes:
+        """Encode ``message``; ``raw_payload`` is the original JSON payload."""
+        ...
+
+    def decode(self, data: bytes) -> TaskMessage:
+        """Decode and validate a message produced by :meth:`encode`."""
+        ...
+
+
+class MsgspecJsonCodec:
+    """JSON via msgspec."""
+
+    name = "json"
+
+    def __init__(self) -> None:
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder(TaskMessage)
+
+    def encode(self, message: TaskMessage, raw_payload: bytes | None = None) -> bytes:
+        if raw_payload is None:
+            return self._encoder.encode(message)
+        return self._encoder.encode(
+            _RawMessage(
+                task_id=message.task_id,
+                timestamp=message.timestamp,
+                payload=msgspec.Raw(raw_payload),
+                trace_context=message.trace_context,
+            )
+        )
+
+    def decode(self, data: bytes) -> TaskMessage:
+        return self._decoder.decode(data)
+
+
+class OrjsonCodec:
+    """JSON via orjson, validated into structs with msgspec."""
+
+    name = "orjson"
+
+    def encode(self, message: TaskMessage, raw_payload: bytes | None = None) -> bytes:
+        if raw_payload is None:
+            return orjson.dumps(msgspec.to_builtins(message))
+        return orjson.dumps(
+            {
+                "task_id": message.task_id,
+                "timestamp": message.timestamp,
+                "payload": orjson.Fragment(raw_payload),
+                "trace_context": msgspec.to_builtins(message.trace_context),
+            }
+        )
+
+    def decode(self, data: bytes) -> TaskMessage:
+        try:
+            return msgspec.convert(orjson.loads(data), TaskMessage)
+        except orjson.JSONDecodeError as exc:
+            raise msgspec.DecodeError(str(exc)) from exc
+
+
+class MsgpackCodec:
+    """MessagePack via msgspec; the payload is always re-encoded."""
+
+    name = "msgpack"
+
+    def __init__(self) -> None:
+        self._encoder = msgspec.msgpack.Encoder()
+        self._decoder = msgspec.msgpack.Decoder(TaskMessage)
+
+    def encode(self, message: TaskMessage, raw_payload: bytes | None = None) -> bytes:
+        return self._encoder.encode(message)
+
+    def decode(self, data: bytes) -> TaskMessage:
+        return self._decoder.decode(data)
+
+
+CODECS: dict[str, Codec] = {
+    codec.name: codec for codec in (MsgspecJsonCodec(), OrjsonCodec(), MsgpackCodec())
+}
+
+
+def get_codec(name: str) -> Codec:
+    """Return the codec registered under ``name``."""
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown task wire format: {name}") from None
+
+
+def decode_entry(fields: dict[bytes, bytes]) -> TaskMessage:
+    """Decode a stream entry using the codec named in its ``format`` field."""
+    name = fields.get(b"format", b"json").decode()
+    return get_codec(name).decode(fields.get(b"task", b"{}"))
@@ -1,26 +1,128 @@
 from __future__ import annotations
 
+import time
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from uuid import uuid4
 
+from core import stages
+from .cache import TTLCache
 from .models import TaskMessage, TaskPayload, TraceContext
 from .repository import TaskRepository
 
+IDEMPOTENCY_METADATA_KEY = "idempotency_key"
+
+
+@dataclass(frozen=True)
+class Enqueued:
+    """Outcome of enqueuing one payload."""
+
+    task_id: str
+    duplicate: bool = False
+
 
 class TaskService:
-    """Service layer for task operations."""
+    """Service layer for task operations.
+
+    A payload with an idempotency key (passed explicitly, or as the
+    ``idempotency_key`` metadata) is enqueued at most once per
+    ``idempotency_ttl`` seconds; repeats get the original task ID back.
+    Keys recently seen by this process are answered from an LRU of
+    ``idempotency_cache_size`` entries without asking Redis.
+    """
 
-    def __init__(self, repo: TaskRepository) -> None:
+    def __init__(
+        self,
+        repo: TaskRepository,
+        idempotency_ttl: int = 86400,
+        idempotency_cache_size: int = 10000,
+    ) -> None:
         self._repo = repo
+        self._idempotency_ttl = idempotency_ttl
+        self._recent: TTLCache[str] = TTLCache(idempotency_cache_size, idempotency_ttl)
 
     async def enqueue(
-        self, payload: TaskPayload, trace_id: str = "", span_id: str = ""
-    ) -> None:
-        """Create and store task message."""
-        message = TaskMessage(
-            task_id=str(uuid4()),
-            timestamp=datetime.now(timezone.utc).isoformat(),
-            payload=payload,
-            trace_context=TraceContext(trace_id=trace_id, span_id=span_id),
+        self,
+        payload: TaskPayload,
+        trace_context: TraceContext | None = None,
+        raw_payload: bytes | None = None,
+        idempotency_key: str | None = None,
+    ) -> Enqueued:
+        """Create and store task message.
+
+        ``raw_payload`` is the JSON the payload was decoded from, if any.
+        """
+        key = idempotency_key or _metadata_key(payload)
+        if key is not None:
+            known = self._recent.get(key)
+            if known is not None:
+                return Enqueued(known, duplicate=True)
+
+        start = time.perf_counter_ns()
+        message = _new_message(payload, trace_context)
+        stages.record("enqueue.build_message", start)
+        if key is None:
+            await self._repo.add(message, raw_payload)
+            return Enqueued(message.task_id)
+
+        owner = await self._repo.add_unique(
+            message, key, self._idempotency_ttl, raw_payload
+        )
+        self._recent.put(key, owner)
+        return Enqueued(owner, duplicate=owner != message.task_id)
+
+    async def enqueue_many(
+        self,
+        payloads: list[TaskPayload],
+        trace_context: TraceContext | None = None,
+        raw_payloads: list[bytes | None] | None = None,
+    ) -> list[Enqueued]:
+        """Create and store several task messages in one round trip.
+
+        Returns one result per payload in input order. Payloads are
+        deduplicated by their ``idempotency_key`` metadata.
+        """
+        results: list[Enqueued | None] = [None] * len(payloads)
+        raws = raw_payloads or [None] * len(payloads)
+        indexes: list[int] = []
+        messages: list[TaskMessage] = []
+        keys: list[str | None] = []
+        for index, payload in enumerate(payloads):
+            key = _metadata_key(payload)
+            known = self._recent.get(key) if key is not None else None
+            if known is not None:
+                results[index] = Enqueued(known, duplicate=True)
+                continue
+            indexes.append(index)
+            messages.append(_new_message(payload, trace_context))
+            keys.append(key)
+
+        stored = await self._repo.add_many(
+            messages,
+            [raws[index] for index in indexes],
+            keys=keys,
+            ttl=self._idempotency_ttl,
         )
-        await self._repo.add(message)
+        for index, message, key, result in zip(indexes, messages, keys, stored):
+            if key is None:
+                results[index] = Enqueued(message.task_id)
+                continue
+            self._recent.put(key, result)
+            results[index] = Enqueued(result, duplicate=result != message.task_id)
+        return [result for result in results if result is not None]
+
+
+def _metadata_key(payload: TaskPayload) -> str | None:
+    key = payload.metadata.get(IDEMPOTENCY_METADATA_KEY)
+    return key if isinstance(key, str) and key else None
+
+
+def _new_message(
+    payload: TaskPayload, trace_context: TraceContext | None
+) -> TaskMessage:
+    return TaskMessage(
+        task_id=str(uuid4()),
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        payload=payload,
+        trace_context=trace_context or TraceContext(trace_id="", span_id=""),
+    )
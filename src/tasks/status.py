@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator
+
+import msgspec
+from loguru import logger
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline, PubSub
+
+from .cache import TTLCache
+from .models import TaskStatus
+
+TERMINAL_STATUSES = frozenset({"succeeded", "failed"})
+
+# Store a status hash and notify long-polling readers, if there are any.
+_RECORD_SCRIPT = """
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+if redis.call('PUBSUB', 'NUMSUB', KEYS[1])[2] > 0 then
+    redis.call('PUBLISH', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+
+class TaskStatusStore:
+    """Task status and results kept in Redis hashes.
+
+    The outcome of each attempt (see :func:`status_update`) is queued with
+    :meth:`record` onto a pipeline the caller already sends, normally the
+    acknowledgement flush of :class:`service.acks.AckBuffer`. It is written
+    to ``{stream}:status:{task_id}`` with a ``ttl`` second expiry and
+    published on a channel of the same name only while someone is
+    subscribed to it.
+
+    :meth:`get` answers from an in-process cache of ``cache_size`` entries
+    for ``cache_ttl`` seconds. :meth:`wait` long-polls: it subscribes to the
+    task's channel, so a waiting request costs no Redis traffic until the
+    status changes. All waits of a process share one pub/sub connection.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream: str,
+        ttl: int,
+        cache_ttl: float = 1.0,
+        cache_size: int = 10000,
+    ) -> None:
+        self._redis = redis
+        self._prefix = f"{stream}:status:"
+        self._ttl = ttl
+        self._cache: TTLCache[TaskStatus] = TTLCache(cache_size, cache_ttl)
+        self._watcher: _StatusWatcher | None = None
+        self._record_script: Any = None
+
+    async def record(self, pipe: Pipeline, updates: list[TaskStatus]) -> None:
+        """Queue the writes for ``updates`` onto ``pipe``."""
+        if self._record_script is None:
+            self._record_script = self._redis.register_script(_RECORD_SCRIPT)
+        for update in updates:
+            args: list[bytes | str | int] = [
+                self._ttl,
+                update.status,
+                "status",
+                update.status,
+                "attempts",
+                update.attempts,
+                "updated_at",
+                update.updated_at,
+            ]
+            if update.result is not None:
+                args += ["result", bytes(update.result)]
+            if update.error is not None:
+                args += ["error", update.error]
+            await self._record_script(
+                keys=[self._prefix + update.task_id], args=args, client=pipe
+            )
+
+    async def get(self, task_id: str, cached: bool = True) -> TaskStatus | None:
+        """Return the recorded status of ``task_id``, or ``None`` if unknown.
+
+        Tasks that are still queued or running have no status yet.
+        """
+        if cached:
+            status = self._cache.get(task_id)
+            if status is not None:
+                return status
+        fields = await self._redis.hgetall(self._prefix + task_id)
+        if not fields:
+            return None
+        status = _decode(task_id, fields)
+        self._cache.put(task_id, status)
+        return status
+
+    async def wait(self, task_id: str, timeout: float) -> TaskStatus | None:
+        """Return the status of ``task_id`` once it has finished.
+
+        Waits up to ``timeout`` seconds for a finished status and returns
+        early on any change, so a retry is reported as soon as it is
+        scheduled.
+        """
+        if self._watcher is None:
+            self._watcher = _StatusWatcher(self._redis.pubsub())
+        async with self._watcher.watch(self._prefix + task_id) as changed:
+            status = await self.get(task_id, cached=False)
+            if status is not None and status.status in TERMINAL_STATUSES:
+                return status
+            try:
+                async with asyncio.timeout(timeout):
+                    await changed
+            except TimeoutError:
+                return status
+        return await self.get(task_id, cached=False)
+
+    async def close(self) -> None:
+        """Release the pub/sub connection used by :meth:`wait`."""
+        if self._watcher is not None:
+            await self._watcher.close()
+            self._watcher = None
+
+
+class _StatusWatcher:
+    """Fan pub/sub notifications out to waiting requests.
+
+    A channel is subscribed while at least one request waits on it, and a
+    single reader task runs while any channel is subscribed.
+    """
+
+    def __init__(self, pubsub: PubSub) -> None:
+        self._pubsub = pubsub
+        self._waiters: dict[str, set[asyncio.Future[None]]] = {}
+        self._reader: asyncio.Task[None] | None = None
+
+    @contextlib.asynccontextmanager
+    async def watch(self, channel: str) -> AsyncIterator[asyncio.Future[None]]:
+        """Yield a future resolved by the next message on ``channel``."""
+        changed: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(channel, set())
+        waiters.add(changed)
+        try:
+            if len(waiters) == 1:
+                await self._pubsub.subscribe(channel)
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+            yield changed
+        finally:
+            waiters.discard(changed)
+            if not waiters and self._waiters.get(channel) is waiters:
+                del self._waiters[channel]
+                with contextlib.suppress(Exception):
+                    await self._pubsub.unsubscribe(channel)
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reader
+        await self._pubsub.aclose()
+
+    async def _read(self) -> None:
+        while self._waiters:
+            try:
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+            except Exception as exc:
+                logger.error(f"Task status subscription failed: {exc}")
+                return
+            if message is None:
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            for changed in self._waiters.get(channel, ()):
+                if not changed.done():
+                    changed.set_result(None)
+
+
+def status_update(
+    task_id: str,
+    status: str,
+    attempts: int = 1,
+    result: Any = None,
+    error: str | None = None,
+) -> TaskStatus:
+    """Build the status of an attempt; ``result`` is encoded as JSON."""
+    return TaskStatus(
+        task_id=task_id,
+        status=status,
+        updated_at=datetime.now(timezone.utc).isoformat(),
+        attempts=attempts,
+        result=(
+            msgspec.Raw(msgspec.json.encode(result, enc_hook=str))
+            if result is not None
+            else None
+        ),
+        error=error,
+    )
+
+
+def _decode(task_id: str, fields: dict[bytes, bytes]) -> TaskStatus:
+    result = fields.get(b"result")
+    error = fields.get(b"error")
+    return TaskStatus(
+        task_id=task_id,
+        status=fields[b"status"].decode(),
+        updated_at=fields.get(b"updated_at", b"").decode(),
+        attempts=int(fields.get(b"attempts", 1)),
+        result=msgspec.Raw(result) if result is not None else None,
+        error=error.decode() if error is not None else None,
+    )
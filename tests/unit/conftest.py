@@ -0,0 +1,44 @@
+from typing import Any, Callable
+
+import msgspec
+import pytest
+
+from tasks.models import TaskMessage, TaskPayload, TraceContext
+
+
+@pytest.fixture
+def make_message() -> Callable[..., TaskMessage]:
+    """Factory for task messages: ``make_message(task_id, data, metadata)``."""
+
+    def make(
+        task_id: str = "1",
+        data: Any = "foo",
+        metadata: dict | None = None,
+        trace_context: TraceContext | None = None,
+    ) -> TaskMessage:
+        return TaskMessage(
+            task_id=task_id,
+            timestamp="2025-01-01T00:00:00Z",
+            payload=TaskPayload(data=data, metadata=metadata or {}),
+            trace_context=trace_context or TraceContext(trace_id="t", span_id="s"),
+        )
+
+    return make
+
+
+@pytest.fixture
+def make_entry(make_message) -> Callable[..., tuple[bytes, dict[bytes, bytes]]]:
+    """Factory for stream entries ``(message_id, fields)`` of a task.
+
+    Takes the :func:`make_message` arguments; the entry ID defaults to
+    ``{task_id}-0``.
+    """
+
+    def make(
+        task_id: str = "1", *args: Any, message_id: bytes | None = None, **kwargs: Any
+    ) -> tuple[bytes, dict[bytes, bytes]]:
+        message = make_message(task_id, *args, **kwargs)
+        entry_id = message_id or f"{task_id}-0".encode()
+        return entry_id, {b"task": msgspec.json.encode(message)}
+
+    return make
@@ -13,7 +13,7 @@ import main
 async def test_should_finish_tasks_on_shutdown() -> None:
     finished = asyncio.Event()
 
-    async def fake_process(cfg, handler, event):
+    async def fake_process(cfg, handler, event, redis):
         await event.wait()
         finished.set()
 
@@ -21,10 +21,48 @@ async def test_should_finish_tasks_on_shutdown() -> None:
         patch("main.process_tasks", side_effect=fake_process),
         patch("main.logger.info") as log_info,
     ):
+        await main._open_redis()
         await main._start_processor()
         await asyncio.sleep(0)
         await main._stop_processor()
+        await main._close_redis()
         log_info.assert_any_call("graceful shutdown")
 
     assert finished.is_set()
     assert main.app.state.processor_task.done()
+
+
+def _crash_once(directory: str) -> None:
+    import os
+    import time
+
+    marker = Path(directory) / "crashed"
+    if not marker.exists():
+        marker.touch()
+        os._exit(1)
+    (Path(directory) / "restarted").touch()
+    time.sleep(60)
+
+
+def test_should_restart_crashed_worker_and_stop_on_request(tmp_path) -> None:
+    import threading
+    import time
+
+    from core.supervisor import Supervisor, WorkerSpec
+
+    supervisor = Supervisor(
+        [WorkerSpec("worker", _crash_once, 1, (str(tmp_path),))],
+        shutdown_timeout=5,
+        restart_delay=0.01,
+        start_method="fork",
+    )
+    runner = threading.Thread(target=supervisor.run)
+    runner.start()
+    deadline = time.monotonic() + 10
+    while not (tmp_path / "restarted").exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    supervisor.stop()
+    runner.join(10)
+
+    assert (tmp_path / "restarted").exists()
+    assert not runner.is_alive()
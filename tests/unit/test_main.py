@@ -1,17 +1,22 @@
 from __future__ import annotations
 
+import asyncio
 import importlib
 import json
+import os
 from datetime import datetime
 from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import sys
+import pytest
 from loguru import logger
 from starlette.testclient import TestClient
 
 sys.path.append(str(Path(__file__).resolve().parents[2] / "src"))
 from core.config import configure_logging
+from core.health import HealthProbe
+from core.logging_config import flush_logs
 
 
 def _load_app():
@@ -24,31 +29,96 @@ def _load_app():
 def test_should_return_ok_when_redis_available() -> None:
     app, config = _load_app()
     redis_mock = AsyncMock()
-    redis_mock.__aenter__.return_value = redis_mock
-    redis_mock.__aexit__.return_value = False
     redis_mock.ping = AsyncMock(return_value=True)
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(
+        return_value=[7, [{"name": b"processors", "lag": 2, "pending": 3}]]
+    )
+    redis_mock.pipeline = MagicMock(return_value=pipe)
+    probe = HealthProbe(redis_mock, config.redis_stream_name, "processors")
+    asyncio.run(probe.probe())
+    app.state.health_probe = probe
 
-    with patch("main.Redis.from_url", return_value=redis_mock):
-        client = TestClient(app)
-        response = client.get("/health")
+    client = TestClient(app)
+    response = client.get("/health")
+    redis_mock.ping.reset_mock()
+    assert client.get("/health/ready").status_code == 200
+    redis_mock.ping.assert_not_called()
 
     assert response.status_code == 200
     body = response.json()
     assert body["status"] == "healthy"
     assert body["redis_connected"] is True
     assert body["version"] == config.service_version
+    assert body["stream_length"] == 7
+    assert body["consumer_lag"] == 2
+    assert body["pending"] == 3
     datetime.fromisoformat(body["timestamp"])
 
 
-def test_should_output_json_when_logging_configured(capsys) -> None:
-    configure_logging()
-    logger.bind(task_id="1", trace_id="abc").info("test")
-    log_line = capsys.readouterr().out.strip()
-    record = json.loads(log_line)
-    assert record["level"] == "INFO"
-    assert record["message"] == "test"
-    with open("loki.log") as fh:
-        assert "test" in fh.read()
+def test_should_probe_every_lane_stream() -> None:
+    app, _ = _load_app()
+    redis_mock = AsyncMock()
+    redis_mock.ping = AsyncMock(return_value=True)
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(
+        return_value=[
+            4,
+            [{"name": b"processors", "lag": 1, "pending": 2}],
+            6,
+            [{"name": b"processors", "lag": None, "pending": 5}],
+        ]
+    )
+    redis_mock.pipeline = MagicMock(return_value=pipe)
+    probe = HealthProbe(
+        redis_mock, "s", "processors", lanes={"high": "s:high", "normal": "s"}
+    )
+    asyncio.run(probe.probe())
+    app.state.health_probe = probe
+
+    body = TestClient(app).get("/health").json()
+
+    assert [call.args[0] for call in pipe.xlen.call_args_list] == ["s:high", "s"]
+    redis_mock.pipeline.assert_called_once()
+    assert body["stream_length"] == 10
+    assert body["consumer_lag"] == 1
+    assert body["pending"] == 7
+    assert body["lanes"] == {
+        "high": {"stream_length": 4, "consumer_lag": 1, "pending": 2},
+        "normal": {"stream_length": 6, "consumer_lag": None, "pending": 5},
+    }
+
+
+def test_should_report_unhealthy_when_probe_fails() -> None:
+    app, _ = _load_app()
+    redis_mock = AsyncMock()
+    redis_mock.ping = AsyncMock(side_effect=ConnectionError("down"))
+    probe = HealthProbe(redis_mock, "stream", "group")
+    asyncio.run(probe.probe())
+    app.state.health_probe = probe
+
+    client = TestClient(app)
+
+    assert client.get("/health").status_code == 503
+    assert client.get("/health/ready").status_code == 503
+    assert client.get("/health/live").status_code == 200
+
+
+def test_should_output_json_when_logging_configured(capsys, tmp_path) -> None:
+    from core.config import AppConfig
+
+    log_file = tmp_path / "loki.log"
+    configure_logging(AppConfig(log_file_path=str(log_file)))
+    try:
+        logger.bind(task_id="1", trace_id="abc").info("test")
+        flush_logs()
+        log_line = capsys.readouterr().out.strip()
+        record = json.loads(log_line)
+        assert record["level"] == "INFO"
+        assert record["message"] == "test"
+        assert "test" in log_file.read_text()
+    finally:
+        logger.remove()
 
 
 def test_should_send_metrics_via_statsd() -> None:
@@ -69,3 +139,264 @@ def test_should_create_tracing_span() -> None:
         client = TestClient(app)
         client.get("/health")
         span.assert_called_with("api_request_span")
+
+
+def test_should_report_redis_pool_saturation() -> None:
+    from core.config import AppConfig
+    from core.redis_client import create_redis, report_pool_metrics
+
+    redis = create_redis(AppConfig(redis_max_connections=4))
+    pool = redis.connection_pool
+    pool._in_use_connections.update({object(), object()})
+    with patch("core.metrics.statsd_client") as statsd:
+        report_pool_metrics(redis)
+    statsd.gauge.assert_any_call("redis_pool_in_use", 2)
+    statsd.gauge.assert_any_call("redis_pool_saturation", 50)
+
+
+def test_should_record_status_and_route_in_request_metrics() -> None:
+    app, _ = _load_app()
+    with patch("core.metrics.statsd_client") as statsd:
+        client = TestClient(app)
+        client.post("/tasks", json={"metadata": {}})
+    statsd.incr.assert_any_call("request_status.400")
+    timings = [call.args[0] for call in statsd.timing.call_args_list]
+    assert "route.tasks.duration" in timings
+
+
+def test_should_aggregate_metrics_into_packed_datagrams() -> None:
+    import socket
+
+    from core.metrics import BufferedStatsClient
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(0.2)
+    port = server.getsockname()[1]
+    client = BufferedStatsClient("127.0.0.1", port, prefix="svc", max_packet_size=64)
+
+    for _ in range(3):
+        client.incr("request_count")
+    client.gauge("queue", 5)
+    client.gauge("queue", 7)
+    client.timing("latency", 12)
+    client.timing("latency", 15)
+    client.flush()
+
+    lines = []
+    while True:
+        try:
+            packet = server.recv(65535)
+        except socket.timeout:
+            break
+        assert len(packet) <= 64
+        lines.extend(packet.decode().split("\n"))
+    client.close()
+    server.close()
+
+    assert sorted(lines) == sorted(
+        [
+            "svc.request_count:3|c",
+            "svc.queue:7|g",
+            "svc.latency:12|ms",
+            "svc.latency:15|ms",
+        ]
+    )
+
+
+def test_should_drop_log_lines_when_queue_full() -> None:
+    import threading
+    import time
+
+    from core.logging_config import LogPipeline
+
+    release = threading.Event()
+    written = []
+
+    class SlowStream:
+        def write(self, data: str) -> None:
+            release.wait(1)
+            written.append(data)
+
+        def flush(self) -> None:
+            pass
+
+    pipeline = LogPipeline(stream=SlowStream(), queue_size=1, overflow="drop")
+    pipeline.put(b"first")
+    while pipeline._queue.qsize():
+        time.sleep(0.001)
+    pipeline.put(b"second")
+    pipeline.put(b"third")
+    release.set()
+    pipeline.stop()
+
+    assert pipeline.dropped == 1
+    assert "".join(written) == "first\nsecond\n"
+
+
+def test_should_rotate_log_file_when_size_exceeded(tmp_path) -> None:
+    from core.logging_config import LogPipeline
+
+    path = tmp_path / "app.log"
+    pipeline = LogPipeline(file_path=str(path), max_bytes=16, backup_count=2)
+    for line in (b"aaaaaaaaaa", b"bbbbbbbbbb", b"cccccccccc"):
+        pipeline.put(line)
+        pipeline.drain()
+    pipeline.stop()
+
+    assert path.read_bytes() == b"cccccccccc\n"
+    assert (tmp_path / "app.log.1").read_bytes() == b"bbbbbbbbbb\n"
+    assert (tmp_path / "app.log.2").read_bytes() == b"aaaaaaaaaa\n"
+
+
+def test_should_report_percentiles_from_log_linear_buckets() -> None:
+    from core.stages import LatencyHistogram
+
+    histogram = LatencyHistogram()
+    for micros in range(1, 10001):
+        histogram.record(micros)
+
+    assert histogram.count == 10000
+    assert abs(histogram.percentile(0.5) - 5000) / 5000 < 0.07
+    assert abs(histogram.percentile(0.99) - 9900) / 9900 < 0.07
+    assert histogram.percentile(1.0) == 10000
+
+
+@pytest.fixture
+def debug_app(monkeypatch):
+    """The app reloaded with ``debug_token`` set to ``secret``."""
+    monkeypatch.setenv("DEBUG_TOKEN", "secret")
+    yield _load_app()
+    monkeypatch.delenv("DEBUG_TOKEN")
+    _load_app()
+
+
+def test_should_expose_stage_latencies_on_debug_metrics(debug_app) -> None:
+    from core import stages
+    from tasks.repository import TaskRepository
+    from tasks.service import TaskService
+
+    app, config = debug_app
+    redis_mock = AsyncMock()
+    redis_mock.xadd = AsyncMock(return_value=b"1-0")
+    app.state.task_service = TaskService(
+        TaskRepository(redis_mock, config.redis_stream_name)
+    )
+    stages.reset()
+    client = TestClient(app)
+
+    client.post("/tasks", json={"data": 1})
+    denied = client.get("/debug/metrics")
+    response = client.get("/debug/metrics", headers={"X-Debug-Token": "secret"})
+
+    assert denied.status_code == 403
+    assert response.status_code == 200
+    recorded = response.json()["stages"]
+    for stage in ("api.read_body", "api.validate", "api.enqueue", "redis.xadd"):
+        assert recorded[stage]["count"] == 1
+
+
+def test_should_not_mount_debug_endpoints_without_token() -> None:
+    app, _ = _load_app()
+    client = TestClient(app)
+
+    assert client.post("/debug/profile").status_code == 404
+    assert client.get("/debug/metrics").status_code == 404
+
+
+def test_should_guard_profiling_endpoint_with_token(debug_app) -> None:
+    app, _ = debug_app
+    client = TestClient(app)
+
+    denied = client.post("/debug/profile", headers={"X-Debug-Token": "nope"})
+    response = client.post(
+        "/debug/profile?seconds=0.01&kind=memory",
+        headers={"X-Debug-Token": "secret"},
+    )
+
+    assert denied.status_code == 403
+    assert response.status_code == 200
+
+
+def test_should_give_each_worker_its_own_log_and_one_background_runner(
+    monkeypatch,
+) -> None:
+    import main
+
+    for field in ("service_role", "background_jobs", "log_file_path"):
+        monkeypatch.setattr(main.config, field, getattr(main.config, field))
+    roles = {}
+    workers = (("http-0", "api"), ("http-1", "api"), ("consumer-0", "consumer"))
+    for name, role in workers:
+        main.config.log_file_path = "logs/loki.log"
+        with (
+            patch("multiprocessing.current_process") as current,
+            patch.object(main, "configure_logging") as configure,
+        ):
+            current.return_value.name = name
+            main._configure_worker(role)
+        configure.assert_called_once_with(main.config)
+        roles[name] = (main.config.log_file_path, main.config.background_jobs)
+
+    assert roles == {
+        "http-0": ("logs/loki.http-0.log", True),
+        "http-1": ("logs/loki.http-1.log", False),
+        "consumer-0": ("logs/loki.consumer-0.log", False),
+    }
+
+
+def test_should_run_background_jobs_in_first_consumer_without_http_workers(
+    monkeypatch,
+) -> None:
+    import main
+
+    for field in ("service_role", "background_jobs", "log_file_path"):
+        monkeypatch.setattr(main.config, field, getattr(main.config, field))
+    monkeypatch.setattr(main.config, "worker_processes", "0")
+    roles = {}
+    for name in ("consumer-0", "consumer-1"):
+        with (
+            patch("multiprocessing.current_process") as current,
+            patch.object(main, "configure_logging"),
+        ):
+            current.return_value.name = name
+            main._configure_worker("consumer")
+        roles[name] = main.config.background_jobs
+
+    assert roles == {"consumer-0": True, "consumer-1": False}
+
+
+def test_should_report_not_ready_once_told_to_stop() -> None:
+    import signal
+
+    import uvicorn
+
+    app, _ = _load_app()
+    import main
+
+    probe = MagicMock()
+    probe.healthy = MagicMock(return_value=True)
+    app.state.health_probe = probe
+    client = TestClient(app)
+    assert client.get("/health/ready").status_code == 200
+
+    server = main._DrainingServer(uvicorn.Config(app))
+    server.handle_exit(signal.SIGTERM, None)
+
+    assert server.should_exit
+    assert client.get("/health/ready").status_code == 503
+    assert client.get("/health/live").status_code == 200
+
+
+def test_should_not_open_log_file_on_import(tmp_path) -> None:
+    import subprocess
+
+    src = Path(__file__).resolve().parents[2] / "src"
+    subprocess.run(
+        [sys.executable, "-c", "import main"],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": str(src)},
+        check=True,
+    )
+
+    assert list(tmp_path.iterdir()) == []
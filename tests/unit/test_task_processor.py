@@ -1,38 +1,44 @@
 import asyncio
 import contextlib
+import os
 import sys
+import time
 from pathlib import Path
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import msgspec
 import pytest
 
 sys.path.append(str(Path(__file__).resolve().parents[2] / "src"))
 from core.config import AppConfig
 from service.task_processor import process_tasks
-from tasks.models import TaskPayload, TaskMessage, TraceContext
+from service.acks import AckBuffer
+from service.consumers import ConsumerRegistry, resolve_consumer_name
+from service.retry import RetryPolicy
+from tasks.models import TaskMessage, TraceContext
+
+
+def _pipeline(redis_mock: AsyncMock) -> MagicMock:
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[1, 1])
+    redis_mock.pipeline = MagicMock(return_value=pipe)
+    return pipe
 
 
 @pytest.mark.asyncio
-async def test_should_process_task_asynchronously() -> None:
+async def test_should_process_task_asynchronously(make_message) -> None:
     config = AppConfig()
-    message = TaskMessage(
-        task_id="1",
-        timestamp="2025-01-01T00:00:00Z",
-        payload=TaskPayload(data="foo", metadata={}),
-        trace_context=TraceContext(trace_id="t", span_id="s"),
-    )
+    message = make_message()
     redis_mock = AsyncMock()
-    redis_mock.__aenter__.return_value = redis_mock
-    redis_mock.__aexit__.return_value = False
     redis_mock.xgroup_create = AsyncMock()
-    redis_mock.xack = AsyncMock()
-    redis_mock.xdel = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    pipe = _pipeline(redis_mock)
     redis_mock.xreadgroup = AsyncMock(
         side_effect=[
             [
                 (
                     config.redis_stream_name.encode(),
-                    [(b"1-0", {b"task": message.model_dump_json().encode()})],
+                    [(b"1-0", {b"task": msgspec.json.encode(message)})],
                 )
             ],
             asyncio.CancelledError(),
@@ -43,16 +49,713 @@ async def test_should_process_task_asynchronously() -> None:
     async def handler(msg: TaskMessage) -> None:
         handled.append(msg.task_id)
 
-    with patch("service.task_processor.Redis.from_url", return_value=redis_mock):
-        shutdown_event = asyncio.Event()
-        task = asyncio.create_task(process_tasks(config, handler, shutdown_event))
-        await asyncio.sleep(0)
-        task.cancel()
-        with contextlib.suppress(asyncio.CancelledError):
-            await task
+    shutdown_event = asyncio.Event()
+    task = asyncio.create_task(
+        process_tasks(config, handler, shutdown_event, redis_mock)
+    )
+    await asyncio.sleep(0)
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
 
     assert handled == ["1"]
-    redis_mock.xack.assert_called_once_with(
+    pipe.xack.assert_called_once_with(
         config.redis_stream_name, config.redis_consumer_group, b"1-0"
     )
-    redis_mock.xdel.assert_called_once_with(config.redis_stream_name, b"1-0")
+    pipe.xdel.assert_called_once_with(config.redis_stream_name, b"1-0")
+
+
+@pytest.mark.asyncio
+async def test_should_run_handlers_concurrently_up_to_limit(make_entry) -> None:
+    config = AppConfig(max_concurrent_tasks=2, redis_read_count=10)
+    entries = [make_entry(str(idx)) for idx in range(2)]
+    redis_mock = AsyncMock()
+    redis_mock.xreadgroup = AsyncMock(
+        return_value=[(config.redis_stream_name.encode(), entries)]
+    )
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    pipe = _pipeline(redis_mock)
+    gate = asyncio.Event()
+    started = []
+
+    async def handler(msg: TaskMessage) -> None:
+        started.append(msg.task_id)
+        await gate.wait()
+
+    shutdown_event = asyncio.Event()
+    task = asyncio.create_task(
+        process_tasks(config, handler, shutdown_event, redis_mock)
+    )
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    assert started == ["0", "1"]
+    redis_mock.xreadgroup.assert_called_once()
+    assert redis_mock.xreadgroup.call_args.kwargs["count"] == 2
+
+    shutdown_event.set()
+    gate.set()
+    await asyncio.wait_for(task, 1)
+    pipe.xack.assert_called_once_with(
+        config.redis_stream_name, config.redis_consumer_group, b"0-0", b"1-0"
+    )
+
+
+@pytest.mark.asyncio
+async def test_should_flush_acks_in_one_pipeline_when_batch_full() -> None:
+    redis_mock = AsyncMock()
+    pipe = _pipeline(redis_mock)
+    acks = AckBuffer(redis_mock, "stream", "group", max_size=3)
+
+    await acks.add(b"1-0")
+    await acks.add(b"2-0")
+    pipe.execute.assert_not_called()
+    await acks.add(b"3-0")
+
+    pipe.xack.assert_called_once_with("stream", "group", b"1-0", b"2-0", b"3-0")
+    pipe.xdel.assert_called_once_with("stream", b"1-0", b"2-0", b"3-0")
+    pipe.execute.assert_awaited_once()
+    assert len(acks) == 0
+
+
+@pytest.mark.asyncio
+async def test_should_keep_acks_buffered_when_flush_fails() -> None:
+    redis_mock = AsyncMock()
+    pipe = _pipeline(redis_mock)
+    pipe.execute = AsyncMock(side_effect=ConnectionError("down"))
+    acks = AckBuffer(redis_mock, "stream", "group", max_size=10)
+
+    await acks.add(b"1-0")
+    await acks.flush()
+
+    assert len(acks) == 1
+
+
+@pytest.mark.asyncio
+async def test_should_process_reclaimed_entries_and_drop_poison(make_message) -> None:
+    config = AppConfig(reclaim_max_deliveries=3)
+    raw = msgspec.json.encode(make_message("r"))
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(
+        return_value=[
+            b"0-0",
+            [(b"5-0", {b"task": raw}), (b"6-0", {b"task": raw}), (b"7-0", None)],
+            [],
+        ]
+    )
+    redis_mock.xpending_range = AsyncMock(
+        return_value=[
+            {"message_id": b"5-0", "times_delivered": 2},
+            {"message_id": b"6-0", "times_delivered": 4},
+        ]
+    )
+    redis_mock.xreadgroup = AsyncMock(side_effect=asyncio.CancelledError())
+    pipe = _pipeline(redis_mock)
+    handled = []
+
+    async def handler(msg: TaskMessage) -> None:
+        handled.append(msg.task_id)
+
+    await process_tasks(config, handler, asyncio.Event(), redis_mock)
+
+    assert handled == ["r"]
+    redis_mock.xautoclaim.assert_awaited_once()
+    assert redis_mock.xautoclaim.call_args.kwargs["min_idle_time"] == (
+        config.reclaim_min_idle_ms
+    )
+    pipe.xack.assert_called_once_with(
+        config.redis_stream_name, config.redis_consumer_group, b"6-0", b"5-0"
+    )
+
+
+@pytest.mark.asyncio
+async def test_should_skip_reclaimed_entries_of_completed_tasks(make_entry) -> None:
+    config = AppConfig(completion_ttl=60)
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(
+        return_value=[
+            b"0-0",
+            [
+                make_entry("done", message_id=b"5-0"),
+                make_entry("new", message_id=b"6-0"),
+            ],
+            [],
+        ]
+    )
+    redis_mock.xpending_range = AsyncMock(return_value=[])
+    redis_mock.exists = AsyncMock(
+        side_effect=lambda key: int(key.endswith(":done:done"))
+    )
+    redis_mock.xreadgroup = AsyncMock(side_effect=asyncio.CancelledError())
+    pipe = _pipeline(redis_mock)
+    handled = []
+
+    async def handler(msg: TaskMessage) -> None:
+        handled.append(msg.task_id)
+
+    await process_tasks(config, handler, asyncio.Event(), redis_mock)
+
+    assert handled == ["new"]
+    redis_mock.set.assert_awaited_once_with(
+        f"{config.redis_stream_name}:done:new", 1, ex=60
+    )
+    assert sorted(pipe.xack.call_args.args[2:]) == [b"5-0", b"6-0"]
+
+
+@pytest.mark.asyncio
+async def test_should_record_result_and_failure_status(make_entry) -> None:
+    config = AppConfig(task_status_ttl=120)
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(
+        return_value=[
+            b"0-0",
+            [
+                make_entry("ok", "ok", message_id=b"5-0"),
+                make_entry("bad", "bad", message_id=b"6-0"),
+            ],
+            [],
+        ]
+    )
+    redis_mock.xpending_range = AsyncMock(return_value=[])
+    redis_mock.xreadgroup = AsyncMock(side_effect=asyncio.CancelledError())
+    pipe = _pipeline(redis_mock)
+    script = AsyncMock()
+    redis_mock.register_script = MagicMock(return_value=script)
+
+    async def handler(msg: TaskMessage) -> dict[str, str]:
+        if msg.task_id == "bad":
+            raise RuntimeError("boom")
+        return {"echo": msg.payload.data}
+
+    await process_tasks(config, handler, asyncio.Event(), redis_mock)
+
+    recorded = {}
+    for call in script.call_args_list:
+        assert call.kwargs["client"] is pipe
+        ttl, _, *fields = call.kwargs["args"]
+        assert ttl == 120
+        recorded[call.kwargs["keys"][0]] = dict(zip(fields[::2], fields[1::2]))
+    prefix = f"{config.redis_stream_name}:status:"
+    assert recorded[prefix + "ok"]["status"] == "succeeded"
+    assert recorded[prefix + "ok"]["result"] == b'{"echo":"ok"}'
+    assert recorded[prefix + "bad"]["status"] == "retrying"
+    assert recorded[prefix + "bad"]["error"] == "boom"
+    pipe.execute.assert_awaited_once()
+
+
+def test_should_derive_unique_consumer_name_when_not_configured() -> None:
+    name = resolve_consumer_name(AppConfig(redis_consumer_name=""))
+
+    assert str(os.getpid()) in name
+    assert resolve_consumer_name(AppConfig(redis_consumer_name="fixed")) == "fixed"
+
+
+@pytest.mark.asyncio
+async def test_should_prune_dead_consumers_without_pending_entries() -> None:
+    now = int(time.time() * 1000)
+    redis_mock = AsyncMock()
+    redis_mock.hgetall = AsyncMock(return_value={b"me": now, b"stale": now - 600000})
+    redis_mock.xinfo_consumers = AsyncMock(
+        return_value=[
+            {"name": b"me", "pending": 0, "idle": 10},
+            {"name": b"stale", "pending": 0, "idle": 600000},
+            {"name": b"crashed", "pending": 3, "idle": 600000},
+            # Joined the group, first heartbeat not sent yet.
+            {"name": b"joining", "pending": 0, "idle": 50},
+        ]
+    )
+    registry = ConsumerRegistry(redis_mock, "stream", "group", "me", ttl=60)
+
+    await registry.prune()
+
+    redis_mock.xgroup_delconsumer.assert_awaited_once_with("stream", "group", "stale")
+
+
+@pytest.mark.asyncio
+async def test_should_stay_in_group_when_leaving_with_pending_entries() -> None:
+    redis_mock = AsyncMock()
+    redis_mock.xinfo_consumers = AsyncMock(return_value=[{"name": b"me", "pending": 2}])
+    registry = ConsumerRegistry(redis_mock, "stream", "group", "me")
+
+    await registry.deregister()
+
+    redis_mock.hdel.assert_awaited_once_with("stream:consumers:group", "me")
+    redis_mock.xgroup_delconsumer.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_should_schedule_retry_without_blocking_when_handler_fails(
+    make_message,
+) -> None:
+    config = AppConfig(retry_max_attempts=3)
+    raw = msgspec.json.encode(make_message("f"))
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    redis_mock.xreadgroup = AsyncMock(
+        side_effect=[
+            [
+                (
+                    config.redis_stream_name.encode(),
+                    [
+                        (b"1-0", {b"task": raw}),
+                        (b"2-0", {b"task": raw, b"attempts": b"2"}),
+                    ],
+                )
+            ],
+            asyncio.CancelledError(),
+        ]
+    )
+    pipe = _pipeline(redis_mock)
+
+    async def handler(msg: TaskMessage) -> None:
+        raise RuntimeError("boom")
+
+    await asyncio.wait_for(
+        process_tasks(config, handler, asyncio.Event(), redis_mock), 0.5
+    )
+
+    redis_mock.zadd.assert_awaited_once()
+    key, members = redis_mock.zadd.call_args.args
+    assert key == config.redis_retry_key
+    entry = msgspec.msgpack.decode(next(iter(members)))
+    assert entry["attempts"] == 1
+    assert entry["error"] == "boom"
+    dead_stream, fields = redis_mock.xadd.call_args.args
+    assert dead_stream == config.redis_dead_letter_stream
+    assert fields["attempts"] == 3
+    assert fields["source_id"] == b"2-0"
+    pipe.xack.assert_called_once_with(
+        config.redis_stream_name, config.redis_consumer_group, b"1-0", b"2-0"
+    )
+
+
+def test_should_back_off_exponentially_up_to_cap() -> None:
+    policy = RetryPolicy(backoff_base=0.1, backoff_factor=2.0, backoff_max=0.3)
+
+    assert [policy.delay(n) for n in (1, 2, 3)] == [0.1, 0.2, 0.3]
+
+
+@pytest.mark.asyncio
+async def test_should_trim_promoted_retries_like_other_producers() -> None:
+    from service.retry import RetryScheduler
+
+    script = AsyncMock(return_value=0)
+    redis_mock = AsyncMock()
+    redis_mock.register_script = MagicMock(return_value=script)
+
+    exact = RetryScheduler(redis_mock, "s", "r", "d", maxlen=50, approximate=False)
+    await exact.promote()
+    assert script.call_args.kwargs["args"][2:] == ["MAXLEN", "=", 50]
+
+    by_age = RetryScheduler(redis_mock, "s", "r", "d", retention=60.0)
+    await by_age.promote()
+    threshold, approximate, cutoff = script.call_args.kwargs["args"][2:]
+    assert (threshold, approximate) == ("MINID", "~")
+    assert cutoff.endswith("-0")
+
+    deferred = RetryScheduler(redis_mock, "s", "r", "d", trim_on_add=False)
+    await deferred.promote()
+    assert len(script.call_args.kwargs["args"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_should_time_out_handler_using_metadata_override(make_message) -> None:
+    config = AppConfig(task_timeout=30)
+    message = make_message("slow", metadata={"timeout": 0.01})
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    redis_mock.xreadgroup = AsyncMock(
+        side_effect=[
+            [
+                (
+                    config.redis_stream_name.encode(),
+                    [(b"1-0", {b"task": msgspec.json.encode(message)})],
+                )
+            ],
+            asyncio.CancelledError(),
+        ]
+    )
+    _pipeline(redis_mock)
+
+    async def handler(msg: TaskMessage) -> None:
+        await asyncio.sleep(10)
+
+    with patch("core.metrics.statsd_client") as statsd:
+        await asyncio.wait_for(
+            process_tasks(config, handler, asyncio.Event(), redis_mock), 1
+        )
+
+    statsd.incr.assert_any_call("task_timeouts")
+    entry = msgspec.msgpack.decode(next(iter(redis_mock.zadd.call_args.args[1])))
+    assert entry["error"] == "timed out"
+
+
+@pytest.mark.asyncio
+async def test_should_continue_enqueuing_trace_when_processing(make_message) -> None:
+    from opentelemetry import trace
+
+    config = AppConfig()
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    message = make_message(
+        trace_context=TraceContext(
+            trace_id=trace_id,
+            span_id="00f067aa0ba902b7",
+            traceparent=f"00-{trace_id}-00f067aa0ba902b7-01",
+        ),
+    )
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    redis_mock.xreadgroup = AsyncMock(
+        side_effect=[
+            [
+                (
+                    config.redis_stream_name.encode(),
+                    [(b"1-0", {b"task": msgspec.json.encode(message)})],
+                )
+            ],
+            asyncio.CancelledError(),
+        ]
+    )
+    _pipeline(redis_mock)
+    seen = []
+
+    async def handler(msg: TaskMessage) -> None:
+        seen.append(trace.get_current_span().get_span_context().trace_id)
+
+    await process_tasks(config, handler, asyncio.Event(), redis_mock)
+
+    assert seen == [int(trace_id, 16)]
+
+
+def test_should_build_ratio_sampler_that_respects_parent() -> None:
+    from core.tracing import make_sampler
+
+    sampler = make_sampler("parentbased_traceidratio", 0.25)
+
+    assert "ParentBased" in sampler.get_description()
+    assert "0.25" in sampler.get_description()
+    with pytest.raises(ValueError):
+        make_sampler("bogus", 1.0)
+
+
+def _lane(name: str, weight: int, entries: int = 0):
+    from service.scheduler import Lane
+
+    lane = Lane(name, name, weight, *(MagicMock() for _ in range(4)))
+    lane.buffer.extend((f"{idx}-0".encode(), {}) for idx in range(entries))
+    return lane
+
+
+def test_should_interleave_lanes_by_weight() -> None:
+    from service.scheduler import LaneScheduler
+
+    high, low = _lane("high", 3, 10), _lane("low", 1, 10)
+    scheduler = LaneScheduler([high, low], "weighted", max_wait=60)
+
+    picks = []
+    for _ in range(8):
+        lane = scheduler.pick()
+        lane.buffer.popleft()
+        picks.append(lane.name)
+
+    assert picks.count("high") == 6
+    assert picks.count("low") == 2
+
+
+def test_should_serve_starved_lane_under_strict_priority() -> None:
+    from service.scheduler import LaneScheduler
+
+    high, low = _lane("high", 1, 10), _lane("low", 1, 10)
+    scheduler = LaneScheduler([high, low], "strict", max_wait=60)
+
+    assert scheduler.pick() is high
+    low.waiting_since -= 61
+    assert scheduler.pick() is low
+    assert scheduler.pick() is high
+
+
+@pytest.mark.asyncio
+async def test_should_read_all_lanes_in_one_call_and_run_high_first(
+    make_entry,
+) -> None:
+    config = AppConfig(
+        priority_lanes=["high", "low"], max_concurrent_tasks=2, redis_read_count=10
+    )
+    high_stream = f"{config.redis_stream_name}:high"
+
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    batches = [
+        [
+            (config.redis_stream_name.encode(), [make_entry("1")]),
+            (high_stream.encode(), [make_entry("2")]),
+        ]
+    ]
+
+    async def read(*args, **kwargs):
+        await asyncio.sleep(0)
+        return batches.pop() if batches else []
+
+    redis_mock.xreadgroup = AsyncMock(side_effect=read)
+    _pipeline(redis_mock)
+    handled = []
+
+    async def handler(msg: TaskMessage) -> None:
+        handled.append(msg.task_id)
+
+    shutdown_event = asyncio.Event()
+    task = asyncio.create_task(
+        process_tasks(config, handler, shutdown_event, redis_mock)
+    )
+    for _ in range(5):
+        await asyncio.sleep(0)
+    shutdown_event.set()
+    await asyncio.wait_for(task, 1)
+
+    assert handled == ["2", "1"]
+    first_read = redis_mock.xreadgroup.call_args_list[0].kwargs
+    assert first_read["streams"] == {high_stream: ">", config.redis_stream_name: ">"}
+    assert first_read["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_should_not_buffer_more_lane_entries_than_free_slots(
+    make_entry,
+) -> None:
+    config = AppConfig(
+        priority_lanes=["high", "low"], max_concurrent_tasks=1, redis_read_count=10
+    )
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    read: list[str] = []
+
+    async def xreadgroup(group, consumer, streams, count, block):
+        # Redis applies COUNT to every stream read.
+        await asyncio.sleep(0)
+        records = []
+        for stream in streams:
+            ids = [str(len(read) + idx) for idx in range(count)]
+            read.extend(ids)
+            records.append((stream.encode(), [make_entry(i) for i in ids]))
+        return records
+
+    redis_mock.xreadgroup = AsyncMock(side_effect=xreadgroup)
+    _pipeline(redis_mock)
+    handled = []
+
+    async def handler(msg: TaskMessage) -> None:
+        handled.append(msg.task_id)
+
+    shutdown_event = asyncio.Event()
+    task = asyncio.create_task(
+        process_tasks(config, handler, shutdown_event, redis_mock)
+    )
+    for _ in range(20):
+        await asyncio.sleep(0)
+    shutdown_event.set()
+    await asyncio.wait_for(task, 1)
+
+    calls = [call.kwargs for call in redis_mock.xreadgroup.call_args_list]
+    assert all(len(call["streams"]) * call["count"] <= 1 for call in calls)
+    assert {stream for call in calls for stream in call["streams"]} == {
+        f"{config.redis_stream_name}:high",
+        config.redis_stream_name,
+    }
+    assert sorted(handled, key=int) == read
+    redis_mock.xclaim.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_should_reset_idle_time_of_entries_left_in_a_lane_buffer(
+    make_entry,
+) -> None:
+    config = AppConfig(priority_lanes=["high", "low"], max_concurrent_tasks=1)
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    batches = [[make_entry("1"), make_entry("2")]]
+
+    async def xreadgroup(group, consumer, streams, count, block):
+        # More entries than requested, so the second one waits in the buffer.
+        await asyncio.sleep(0)
+        return [(next(iter(streams)).encode(), batches.pop())] if batches else []
+
+    redis_mock.xreadgroup = AsyncMock(side_effect=xreadgroup)
+    _pipeline(redis_mock)
+    gate = asyncio.Event()
+    started = []
+
+    async def handler(msg: TaskMessage) -> None:
+        started.append(msg.task_id)
+        await gate.wait()
+
+    shutdown_event = asyncio.Event()
+    task = asyncio.create_task(
+        process_tasks(config, handler, shutdown_event, redis_mock)
+    )
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert started == ["1"]
+    redis_mock.xclaim.assert_not_called()
+    gate.set()
+    for _ in range(5):
+        await asyncio.sleep(0)
+    shutdown_event.set()
+    await asyncio.wait_for(task, 1)
+
+    assert started == ["1", "2"]
+    redis_mock.xclaim.assert_awaited_once()
+    assert redis_mock.xclaim.call_args.args[4] == [b"2-0"]
+
+
+@pytest.mark.asyncio
+async def test_should_route_by_type_and_dead_letter_unknown_types(
+    make_entry,
+) -> None:
+    from service.handlers import HandlerRegistry
+
+    config = AppConfig()
+
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    redis_mock.xreadgroup = AsyncMock(
+        side_effect=[
+            [
+                (
+                    config.redis_stream_name.encode(),
+                    [
+                        make_entry("1", metadata={"type": "email"}),
+                        make_entry("2", metadata={"type": "sms"}),
+                    ],
+                )
+            ],
+            asyncio.CancelledError(),
+        ]
+    )
+    _pipeline(redis_mock)
+    handlers = HandlerRegistry()
+    handled = []
+
+    @handlers.register("email", concurrency=1, timeout=5)
+    async def send_email(msg: TaskMessage) -> None:
+        handled.append(msg.task_id)
+
+    await process_tasks(config, handlers, asyncio.Event(), redis_mock)
+
+    assert handled == ["1"]
+    dead_stream, fields = redis_mock.xadd.call_args.args
+    assert dead_stream == config.redis_dead_letter_stream
+    assert fields["source_id"] == b"2-0"
+    assert "sms" in fields["error"]
+
+
+@pytest.mark.asyncio
+async def test_should_limit_concurrency_per_task_type(make_message) -> None:
+    from service.handlers import HandlerRegistry
+
+    handlers = HandlerRegistry()
+    gate = asyncio.Event()
+    running = []
+
+    @handlers.register("slow", concurrency=1)
+    async def slow(msg: TaskMessage) -> None:
+        running.append(msg.task_id)
+        await gate.wait()
+
+    def task(task_id: str) -> TaskMessage:
+        return make_message(task_id, metadata={"type": "slow"})
+
+    async def run(message: TaskMessage) -> None:
+        async with handlers.slot(message):
+            await handlers.resolve(message).handler(message)
+
+    first = asyncio.create_task(run(task("1")))
+    second = asyncio.create_task(run(task("2")))
+    await asyncio.sleep(0)
+
+    assert running == ["1"]
+    assert handlers.waiting == 1
+    assert handlers.saturated
+    gate.set()
+    await asyncio.gather(first, second)
+    assert running == ["1", "2"]
+    assert handlers.waiting == 0
+    assert not handlers.saturated
+
+
+@pytest.mark.asyncio
+async def test_should_reset_idle_time_of_entries_that_waited_for_a_slot(
+    make_entry,
+) -> None:
+    from service.handlers import HandlerRegistry
+
+    config = AppConfig()
+    handlers = HandlerRegistry()
+    handled = []
+
+    @handlers.register("slow", concurrency=1)
+    async def slow(msg: TaskMessage) -> None:
+        await asyncio.sleep(0.01)
+        handled.append(msg.task_id)
+
+    def entry(task_id: str) -> tuple[bytes, dict[bytes, bytes]]:
+        return make_entry(task_id, metadata={"type": "slow"})
+
+    redis_mock = AsyncMock()
+    redis_mock.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+    _pipeline(redis_mock)
+    redis_mock.xreadgroup = AsyncMock(
+        side_effect=[
+            [(config.redis_stream_name.encode(), [entry("1"), entry("2")])],
+            asyncio.CancelledError(),
+        ]
+    )
+
+    await process_tasks(config, handlers, asyncio.Event(), redis_mock)
+
+    assert handled == ["1", "2"]
+    redis_mock.xclaim.assert_awaited_once()
+    assert redis_mock.xclaim.call_args.args[4] == [b"2-0"]
+    assert redis_mock.xclaim.call_args.kwargs == {"justid": True}
+
+
+def _cpu_handler(msg: TaskMessage) -> TaskMessage:
+    if msg.payload.data != "ok":
+        raise ValueError(f"bad {msg.payload.data}")
+    return msg
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor", ["thread", "process"])
+async def test_should_run_marked_handlers_off_the_event_loop(
+    executor: str, make_message
+) -> None:
+    from service.handlers import HandlerRegistry
+
+    handlers = HandlerRegistry(thread_workers=1, process_workers=1)
+    handlers.add("cpu", _cpu_handler, executor=executor)
+
+    good = make_message("1", "ok", metadata={"type": "cpu"})
+    bad = make_message("2", "nope", metadata={"type": "cpu"})
+
+    try:
+        assert await handlers.call(handlers.resolve(good), good) == good
+        if executor == "process":
+            pool = handlers._executors["process"]
+            assert pool._mp_context.get_start_method() == "forkserver"
+        with pytest.raises(ValueError, match="bad nope"):
+            await handlers.call(handlers.resolve(bad), bad)
+    finally:
+        handlers.shutdown()
+
+
+def test_should_clamp_metadata_and_handler_timeouts(make_message) -> None:
+    from service.task_processor import _task_timeout
+
+    def task(metadata: dict) -> TaskMessage:
+        return make_message(metadata=metadata)
+
+    assert _task_timeout(task({"timeout": 86400}), None, 30) == 30
+    assert _task_timeout(task({"timeout": 5}), 60, 30) == 5
+    assert _task_timeout(task({}), 120, 30) == 30
+    assert _task_timeout(task({}), 10, 30) == 10
+    assert _task_timeout(task({}), None, 30) == 30
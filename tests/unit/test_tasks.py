@@ -1,24 +1,34 @@
+import asyncio
 from pathlib import Path
 import sys
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
 
 from starlette.testclient import TestClient
 
 sys.path.append(str(Path(__file__).resolve().parents[2] / "src"))
+from core.config import AppConfig
 from main import app, config
+from tasks.models import TaskMessage, TraceContext
+from tasks.repository import TaskRepository
+from tasks.serialization import decode_entry, decode_payload, get_codec
+from tasks.service import TaskService
+from tasks.status import TaskStatusStore
 
 
 def test_should_respond_202_when_post_task() -> None:
     redis_mock = AsyncMock()
-    redis_mock.__aenter__.return_value = redis_mock
-    redis_mock.__aexit__.return_value = False
     redis_mock.xadd = AsyncMock(return_value=b"1-0")
+    app.state.task_service = TaskService(
+        TaskRepository(redis_mock, config.redis_stream_name)
+    )
 
-    with patch("main.Redis.from_url", return_value=redis_mock):
-        client = TestClient(app)
-        response = client.post("/tasks", json={"data": "foo", "metadata": {}})
+    client = TestClient(app)
+    response = client.post("/tasks", json={"data": "foo", "metadata": {}})
 
     assert response.status_code == 202
+    assert response.json()["task_id"]
     redis_mock.xadd.assert_called_once()
     args, _ = redis_mock.xadd.call_args
     assert args[0] == config.redis_stream_name
@@ -32,3 +42,373 @@ def test_should_return_413_when_payload_too_large() -> None:
     )
 
     assert response.status_code == 413
+
+
+def test_should_return_413_when_streamed_body_exceeds_limit() -> None:
+    redis_mock = AsyncMock()
+    app.state.task_service = TaskService(
+        TaskRepository(redis_mock, config.redis_stream_name)
+    )
+    chunk = b"x" * 65536
+
+    def chunks():
+        for _ in range(config.max_payload_size // len(chunk) + 1):
+            yield chunk
+
+    client = TestClient(app)
+    response = client.post(
+        "/tasks", content=chunks(), headers={"Content-Type": "application/json"}
+    )
+
+    assert response.status_code == 413
+    redis_mock.xadd.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_should_coalesce_concurrent_adds_into_one_pipeline(make_message) -> None:
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[b"1-0", b"2-0", b"3-0"])
+    redis_mock = AsyncMock()
+    redis_mock.pipeline = MagicMock(return_value=pipe)
+    repo = TaskRepository(redis_mock, "stream", batch_size=10, batch_window=0.01)
+
+    messages = [make_message(str(idx), idx) for idx in range(3)]
+    ids = await asyncio.gather(*(repo.add(message) for message in messages))
+
+    assert ids == ["1-0", "2-0", "3-0"]
+    assert pipe.xadd.call_count == 3
+    pipe.execute.assert_awaited_once()
+    redis_mock.xadd.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_should_fail_only_the_adds_whose_xadd_failed(make_message) -> None:
+    from redis.exceptions import ResponseError
+
+    error = ResponseError("OOM command not allowed")
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[b"1-0", error, b"3-0"])
+    redis_mock = AsyncMock()
+    redis_mock.pipeline = MagicMock(return_value=pipe)
+    repo = TaskRepository(redis_mock, "stream", batch_size=3, batch_window=0.01)
+
+    results = await asyncio.gather(
+        *(repo.add(make_message(str(idx))) for idx in range(3)),
+        return_exceptions=True,
+    )
+
+    assert results == ["1-0", error, "3-0"]
+    pipe.execute.assert_awaited_once_with(raise_on_error=False)
+
+
+@pytest.mark.asyncio
+async def test_should_trim_by_minid_when_retention_set(make_message) -> None:
+    redis_mock = AsyncMock()
+    redis_mock.xadd = AsyncMock(return_value=b"1-0")
+    repo = TaskRepository(redis_mock, "stream", retention=60.0)
+
+    await repo.add(make_message())
+
+    kwargs = redis_mock.xadd.call_args.kwargs
+    assert "maxlen" not in kwargs
+    assert kwargs["approximate"] is True
+    assert kwargs["minid"].endswith("-0")
+
+
+@pytest.mark.asyncio
+async def test_should_leave_trimming_to_background_trimmer(
+    monkeypatch, make_message
+) -> None:
+    from core import metrics
+
+    stats = MagicMock()
+    monkeypatch.setattr(metrics, "statsd_client", stats)
+    redis_mock = AsyncMock()
+    redis_mock.xadd = AsyncMock(return_value=b"1-0")
+    redis_mock.xtrim = AsyncMock(return_value=7)
+    defaults = AppConfig()
+    repo = TaskRepository(
+        redis_mock,
+        "stream",
+        maxlen=10,
+        trim_on_add=defaults.stream_trim_interval <= 0,
+    )
+
+    await repo.add(make_message())
+    await repo.trim()
+
+    assert redis_mock.xadd.call_args.kwargs == {}
+    redis_mock.xtrim.assert_awaited_once_with("stream", maxlen=10, approximate=True)
+    stats.incr.assert_called_once_with("stream_trimmed_entries", 7)
+
+
+@pytest.mark.parametrize("name", ["json", "orjson", "msgpack"])
+def test_should_round_trip_message_for_each_wire_format(name: str) -> None:
+    codec = get_codec(name)
+    raw_payload = b'{"data": {"n": 1}, "metadata": {"k": "v"}}'
+    message = TaskMessage(
+        task_id="1",
+        timestamp="2025-01-01T00:00:00Z",
+        payload=decode_payload(raw_payload),
+        trace_context=TraceContext(trace_id="t", span_id="s"),
+    )
+
+    encoded = codec.encode(message, raw_payload)
+    decoded = decode_entry({b"task": encoded, b"format": name.encode()})
+
+    assert decoded == message
+    if name != "msgpack":
+        assert raw_payload in encoded
+
+
+def test_should_return_400_when_payload_invalid() -> None:
+    client = TestClient(app)
+    response = client.post("/tasks", json={"metadata": {}})
+
+    assert response.status_code == 400
+
+
+def test_should_propagate_traceparent_into_task_message() -> None:
+    redis_mock = AsyncMock()
+    redis_mock.xadd = AsyncMock(return_value=b"1-0")
+    app.state.task_service = TaskService(
+        TaskRepository(redis_mock, config.redis_stream_name)
+    )
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    traceparent = f"00-{trace_id}-00f067aa0ba902b7-01"
+
+    client = TestClient(app)
+    response = client.post(
+        "/tasks",
+        json={"data": "foo"},
+        headers={"traceparent": traceparent},
+    )
+
+    assert response.status_code == 202
+    fields = redis_mock.xadd.call_args.args[1]
+    message = decode_entry(
+        {b"task": fields["task"], b"format": fields["format"].encode()}
+    )
+    assert message.trace_context.trace_id == trace_id
+    assert message.trace_context.traceparent.startswith(f"00-{trace_id}-")
+
+
+def _install_pipeline_repo() -> MagicMock:
+    pipe = MagicMock()
+    redis_mock = AsyncMock()
+    redis_mock.pipeline = MagicMock(return_value=pipe)
+    redis_mock.register_script = MagicMock(return_value=AsyncMock())
+    app.state.task_service = TaskService(
+        TaskRepository(redis_mock, config.redis_stream_name)
+    )
+    return pipe
+
+
+def test_should_enqueue_valid_batch_items_in_one_pipeline() -> None:
+    pipe = _install_pipeline_repo()
+    pipe.execute = AsyncMock(return_value=[b"1-0", b"2-0"])
+
+    client = TestClient(app)
+    response = client.post(
+        "/tasks/batch",
+        json=[{"data": 1}, {"metadata": {}}, {"data": 2}],
+    )
+
+    assert response.status_code == 202
+    results = response.json()["results"]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert "task_id" in results[0] and "task_id" in results[2]
+    assert "error" in results[1]
+    assert pipe.xadd.call_count == 2
+    pipe.execute.assert_awaited_once()
+
+
+def test_should_accept_ndjson_batch() -> None:
+    pipe = _install_pipeline_repo()
+    pipe.execute = AsyncMock(return_value=[b"1-0", b"2-0"])
+
+    client = TestClient(app)
+    response = client.post(
+        "/tasks/batch",
+        content=b'{"data": 1}\n\n{"data": 2}\n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == 202
+    assert all("task_id" in r for r in response.json()["results"])
+    assert pipe.xadd.call_count == 2
+
+
+def test_should_return_413_when_batch_has_too_many_items() -> None:
+    _install_pipeline_repo()
+    client = TestClient(app)
+    items = [{"data": i} for i in range(config.batch_max_items + 1)]
+
+    response = client.post("/tasks/batch", json=items)
+
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_should_route_message_to_priority_lane_stream(make_message) -> None:
+    redis_mock = AsyncMock()
+    redis_mock.xadd = AsyncMock(return_value=b"1-0")
+    repo = TaskRepository(
+        redis_mock, "stream", lanes={"high": "stream:high", "low": "stream"}
+    )
+    urgent = make_message(metadata={"priority": "high"})
+
+    await repo.add(urgent)
+    await repo.add(make_message())
+
+    streams = [call.args[0] for call in redis_mock.xadd.call_args_list]
+    assert streams == ["stream:high", "stream"]
+
+
+def test_should_replay_task_id_for_repeated_idempotency_key() -> None:
+    script = AsyncMock(side_effect=lambda keys, args: args[1].encode())
+    redis_mock = AsyncMock()
+    redis_mock.register_script = MagicMock(return_value=script)
+    app.state.task_service = TaskService(
+        TaskRepository(redis_mock, config.redis_stream_name)
+    )
+    headers = {"Idempotency-Key": "order-42"}
+
+    client = TestClient(app)
+    first = client.post("/tasks", json={"data": 1}, headers=headers)
+    second = client.post("/tasks", json={"data": 1}, headers=headers)
+
+    assert first.status_code == second.status_code == 202
+    assert first.json() == second.json()
+    assert "idempotent-replayed" not in first.headers
+    assert second.headers["idempotent-replayed"] == "true"
+    script.assert_awaited_once()
+    assert script.call_args.kwargs["keys"] == [
+        f"{config.redis_stream_name}:idempotency:order-42",
+        config.redis_stream_name,
+    ]
+    redis_mock.xadd.assert_not_called()
+
+
+def test_should_mark_batch_items_with_used_idempotency_key() -> None:
+    pipe = _install_pipeline_repo()
+    pipe.execute = AsyncMock(return_value=[b"1-0", b"original"])
+
+    client = TestClient(app)
+    response = client.post(
+        "/tasks/batch",
+        json=[{"data": 1}, {"data": 2, "metadata": {"idempotency_key": "k"}}],
+    )
+
+    results = response.json()["results"]
+    assert "duplicate" not in results[0]
+    assert results[1] == {"index": 1, "task_id": "original", "duplicate": True}
+    assert pipe.xadd.call_count == 1
+
+
+def test_should_reject_overlong_idempotency_keys_from_header_and_metadata() -> None:
+    script = AsyncMock()
+    redis_mock = AsyncMock()
+    redis_mock.register_script = MagicMock(return_value=script)
+    app.state.task_service = TaskService(
+        TaskRepository(redis_mock, config.redis_stream_name)
+    )
+    key = "k" * 256
+
+    client = TestClient(app)
+    header = client.post("/tasks", json={"data": 1}, headers={"Idempotency-Key": key})
+    metadata = client.post(
+        "/tasks", json={"data": 1, "metadata": {"idempotency_key": key}}
+    )
+    batch = client.post(
+        "/tasks/batch", json=[{"data": 1, "metadata": {"idempotency_key": key}}]
+    )
+
+    assert header.status_code == metadata.status_code == 400
+    assert batch.json()["results"] == [
+        {"index": 0, "error": "idempotency key too long"}
+    ]
+    script.assert_not_called()
+    redis_mock.xadd.assert_not_called()
+
+
+def test_should_return_task_status_from_short_lived_cache(monkeypatch) -> None:
+    import main
+
+    # Routes read the module's current config, which test_main may reload.
+    monkeypatch.setattr(main.config, "task_status_ttl", 60)
+    redis_mock = AsyncMock()
+    redis_mock.hgetall = AsyncMock(
+        side_effect=[
+            {},
+            {
+                b"status": b"succeeded",
+                b"attempts": b"1",
+                b"updated_at": b"2025-01-01T00:00:00+00:00",
+                b"result": b'{"n":1}',
+            },
+        ]
+    )
+    app.state.task_status = TaskStatusStore(
+        redis_mock, config.redis_stream_name, 60, cache_ttl=30
+    )
+
+    client = TestClient(app)
+    pending = client.get("/tasks/t1")
+    first = client.get("/tasks/t1")
+    second = client.get("/tasks/t1")
+
+    assert pending.status_code == 202
+    assert pending.json() == {
+        "task_id": "t1",
+        "status": "unknown",
+        "updated_at": "",
+        "attempts": 0,
+        "result": None,
+        "error": None,
+    }
+    assert first.status_code == second.status_code == 200
+    assert first.json() == {
+        "task_id": "t1",
+        "status": "succeeded",
+        "updated_at": "2025-01-01T00:00:00+00:00",
+        "attempts": 1,
+        "result": {"n": 1},
+        "error": None,
+    }
+    assert redis_mock.hgetall.await_count == 2
+    redis_mock.hgetall.assert_awaited_with(f"{config.redis_stream_name}:status:t1")
+
+
+@pytest.mark.asyncio
+async def test_should_long_poll_until_status_is_published() -> None:
+    published = asyncio.Event()
+
+    async def get_message(**kwargs):
+        await published.wait()
+        published.clear()
+        return {"type": "message", "channel": b"stream:status:t1", "data": b"x"}
+
+    pubsub = MagicMock()
+    pubsub.subscribe = AsyncMock()
+    pubsub.unsubscribe = AsyncMock()
+    pubsub.aclose = AsyncMock()
+    pubsub.get_message = get_message
+    redis_mock = AsyncMock()
+    redis_mock.pubsub = MagicMock(return_value=pubsub)
+    redis_mock.hgetall = AsyncMock(
+        side_effect=[{}, {b"status": b"failed", b"error": b"boom"}]
+    )
+    store = TaskStatusStore(redis_mock, "stream", 60)
+
+    waiter = asyncio.create_task(store.wait("t1", timeout=5))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+    published.set()
+    status = await asyncio.wait_for(waiter, 1)
+    await store.close()
+
+    assert status is not None
+    assert (status.status, status.error) == ("failed", "boom")
+    pubsub.subscribe.assert_awaited_once_with("stream:status:t1")
+    pubsub.unsubscribe.assert_awaited_once_with("stream:status:t1")